@@ -0,0 +1,63 @@
+import argparse
+import time
+
+import numpy as np
+import polars as pl
+from beartype import beartype
+
+from src.data_generation.train_test_split import create_train_test_split, create_train_test_split_contiguous
+
+
+@beartype
+def synthetic_sessions(num_events: int, seed: int):
+    """
+    Sessions in the format of create_sessions output: sorted by session and timestamp, about 8 events per session
+    spread over 6 weeks
+    """
+    rng = np.random.default_rng(seed)
+    session_lengths = rng.geometric(1 / 8, size=num_events // 4)
+    session_lengths = session_lengths[:np.searchsorted(np.cumsum(session_lengths), num_events) + 1]
+    session_lengths[-1] -= session_lengths.sum() - num_events
+    session = np.repeat(np.arange(1, len(session_lengths) + 1, dtype=np.uint32), session_lengths)
+
+    session_start = rng.integers(1_430_000_000, 1_430_000_000 + 6*7*24*60*60, size=len(session_lengths))
+    gaps = rng.integers(0, 30 * 60, size=num_events)
+    offsets = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[np.cumsum(session_lengths) - session_lengths], session_lengths)
+    timestamp = (np.repeat(session_start, session_lengths) + offsets).astype(np.uint32)
+
+    event = rng.choice(np.array(["view", "addtocart", "transaction"]), size=num_events, p=[0.96, 0.03, 0.01])
+    itemid = rng.integers(0, 400_000, size=num_events, dtype=np.uint32)
+    return pl.DataFrame({"timestamp": timestamp, "event": event, "itemid": itemid, "session": session})
+
+
+@beartype
+def timed(split, sessions_df: pl.DataFrame, train_weeks: int, test_weeks: int):
+    start = time.perf_counter()
+    train_df, test_df = split(sessions_df, train_weeks, test_weeks)
+    return time.perf_counter() - start, train_df, test_df
+
+
+@beartype
+def main(num_events: int, train_weeks: int, test_weeks: int, seed: int):
+    print(f"Generating {num_events:,} events")
+    sessions_df = synthetic_sessions(num_events, seed)
+
+    default_time, train_df, test_df = timed(create_train_test_split, sessions_df, train_weeks, test_weeks)
+    print(f"create_train_test_split: {default_time:.2f}s")
+    contiguous_time, contiguous_train_df, contiguous_test_df = timed(
+        create_train_test_split_contiguous, sessions_df, train_weeks, test_weeks)
+    print(f"create_train_test_split_contiguous: {contiguous_time:.2f}s ({default_time / contiguous_time:.1f}x)")
+
+    # The joins of create_train_test_split do not keep the row order
+    assert train_df.sort(["session", "timestamp"]).equals(contiguous_train_df.sort(["session", "timestamp"]))
+    assert test_df.sort(["session", "timestamp"]).equals(contiguous_test_df.sort(["session", "timestamp"]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-events', type=int, default=100_000_000)
+    parser.add_argument('--train-weeks', type=int, default=3)
+    parser.add_argument('--test-weeks', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    main(args.num_events, args.train_weeks, args.test_weeks, args.seed)
@@ -0,0 +1,34 @@
+import argparse
+import importlib
+import sys
+
+# Subcommands and the modules implementing them. The modules, and with them polars, numpy and beartype, are only
+# imported when their subcommand runs.
+COMMANDS = {
+    "split": ("src.data_generation.train_test_split", "Sessionize the events and split them to train and test sets"),
+    "labels": ("src.data_generation.testset_labels", "Split the test sessions to test sessions and labels"),
+    "categories": ("src.data_generation.product_category_tree", "Create the item categories of the train period"),
+    "pipeline": ("src.pipeline", "Run the split, labels and categories stages in one process"),
+    "item-statistics": ("src.features.item_statistics", "Compute the event counts and popularity of the train items"),
+    "session-features": ("src.features.session_features", "Compute the features of the train and test sessions"),
+    "markov": ("src.models.markov", "Predict the next items of the test sessions with a transition model"),
+    "knn": ("src.models.session_knn", "Predict the next items of the test sessions with session-kNN"),
+    "cache": ("src.models.recommendation_cache", "Precompute the recommendations of single event sessions"),
+    "evaluate": ("src.evaluate", "Evaluate predictions against the test labels"),
+    "replay": ("src.replay", "Replay the test sessions event by event through an online recommender"),
+}
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m src")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, (_, description) in COMMANDS.items():
+        # The options of a subcommand, including --help, are parsed by its module
+        subparsers.add_parser(command, help=description, add_help=False)
+    args, command_argv = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+
+    importlib.import_module(COMMANDS[args.command][0]).cli(command_argv, f"{parser.prog} {args.command}")
+
+
+if __name__ == '__main__':
+    main()
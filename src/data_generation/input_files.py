@@ -0,0 +1,108 @@
+import glob
+import re
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import polars as pl
+from beartype import beartype
+
+# Date and optional hour in file names, e.g. events_2015-05-03.csv, events-2015050314.csv or day=2015-05-03
+FILE_TIME_PATTERN = re.compile(
+    r"(?<!\d)((?:19|20)\d{2})-?(0[1-9]|1[0-2])-?(0[1-9]|[12]\d|3[01])(?:[T_ -]?([01]\d|2[0-3]))?(?!\d)")
+
+
+@beartype
+def expand_input_paths(path: Path, pattern: str = "*"):
+    """
+    Input files of a path that is a file, a directory of csv and parquet files or a glob pattern
+    pattern selects the files of a directory, e.g. "item_properties*". Subdirectories are only searched when the pattern
+    says so, e.g. "**/*" for hive partitioned directories.
+    """
+    if path.is_file():
+        return [path]
+    if path.is_dir():
+        paths = [p for p in path.glob(pattern) if p.is_file()]
+    else:
+        paths = [Path(p) for p in glob.glob(str(path), recursive=True)]
+    paths = sorted(p for p in paths if p.suffix in (".csv", ".parquet"))
+    if not paths:
+        raise FileNotFoundError(f"No csv or parquet files found in {path}")
+    return paths
+
+
+@beartype
+def file_time_range(path: Path):
+    """
+    Time range in seconds covered by a file according to the date and hour in its path, None if there is no date
+    """
+    matches = FILE_TIME_PATTERN.findall(str(path))
+    if not matches:
+        return None
+    year, month, day, hour = matches[-1]
+    try:
+        start = datetime(int(year), int(month), int(day), int(hour or 0), tzinfo=timezone.utc)
+    except ValueError:
+        # Digits that look like a date but are not one, e.g. 20150231
+        return None
+    end = start + (timedelta(hours=1) if hour else timedelta(days=1))
+    return int(start.timestamp()), int(end.timestamp())
+
+
+@beartype
+def prune_files(paths: list[Path], start_ts: int | None, end_ts: int | None):
+    """
+    Drop the files whose file name time range does not overlap [start_ts, end_ts)
+    """
+    if start_ts is None and end_ts is None:
+        return paths
+    kept = []
+    for path in paths:
+        time_range = file_time_range(path)
+        if time_range is not None:
+            if start_ts is not None and time_range[1] <= start_ts:
+                continue
+            if end_ts is not None and time_range[0] >= end_ts:
+                continue
+        kept.append(path)
+    return kept
+
+
+@beartype
+def scan_input_files(paths: list[Path], schema: dict | None = None, start_ts: int | None = None,
+                     end_ts: int | None = None, timestamp_unit: int = 1000):
+    """
+    Lazily scan csv and parquet files with a shared schema, keeping only events in [start_ts, end_ts)
+    start_ts and end_ts are in seconds and the timestamp column is in seconds times timestamp_unit. Files outside the
+    time range are pruned by their file names and the filter is pushed down to the parquet statistics. The files are
+    read in parallel when the frame is collected.
+    """
+    paths = prune_files(paths, start_ts, end_ts)
+    if not paths:
+        raise FileNotFoundError("No input files in the time range")
+
+    frames = []
+    csv_paths = [path for path in paths if path.suffix == ".csv"]
+    if csv_paths:
+        frames.append(pl.scan_csv(csv_paths, schema=schema, low_memory=True))
+    parquet_paths = [path for path in paths if path.suffix == ".parquet"]
+    if parquet_paths:
+        frames.append(pl.scan_parquet(parquet_paths, hive_partitioning=False))
+    if schema is not None:
+        frames = [frame.cast(schema) for frame in frames]
+
+    lazy_df = pl.concat(frames, how="vertical_relaxed") if len(frames) > 1 else frames[0]
+    if start_ts is not None:
+        lazy_df = lazy_df.filter(pl.col("timestamp") >= start_ts * timestamp_unit)
+    if end_ts is not None:
+        lazy_df = lazy_df.filter(pl.col("timestamp") < end_ts * timestamp_unit)
+    return lazy_df
+
+
+@beartype
+def date_timestamp(date: str | None):
+    """
+    Seconds at the start of a YYYY-MM-DD date in UTC
+    """
+    if date is None:
+        return None
+    return int(datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
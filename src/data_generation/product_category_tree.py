@@ -4,39 +4,45 @@ from pathlib import Path
 import polars as pl
 from beartype import beartype
 
+from src.data_generation.input_files import expand_input_paths, scan_input_files
+from src.data_generation.schema import read_sessions, session_columns, sessions_file
+
+CATEGORY_TREE_SCHEMA = {"categoryid": pl.UInt32, "parentid": pl.UInt32}
+
+# we keep timestamp since there is possibility that the category changes over time
+ITEM_PROPERTIES_SCHEMA = {"timestamp": pl.UInt64, "itemid": pl.UInt32, "property": pl.Utf8, "value": pl.Utf8}
+
 
 @beartype
 def get_max_ts(train_set_path: Path):
+    train_set_file = sessions_file(train_set_path, 'train_set')
+    # The last timestamp of a collapsed train set is that of the last repeat
+    timestamp_column = "last_timestamp" if "last_timestamp" in session_columns(train_set_file) else "timestamp"
     return (
-        pl.read_csv(train_set_path / 'train_set.csv', low_memory=True)
-        .select("timestamp")
+        read_sessions(train_set_file, columns=[timestamp_column])
+        .select(timestamp_column)
         .max()
         .item()
     )
 
 
 @beartype
-def main(train_set_path: Path, input_path: Path, output_path: Path, train_weeks: int, test_weeks: int):
+def create_item_categories(input_path: Path, train_start: int, test_start: int):
+    """
+    Categories and parent categories of the items during the train period
+    """
 
-    max_ts = get_max_ts(train_set_path)
-    test_start = max_ts - test_weeks*7*24*60*60
-    train_start = test_start - train_weeks*7*24*60*60
-
-    print("Reading the dataset")
     # category tree
-    df_schema = {"categoryid": pl.UInt32, "parentid": pl.UInt32}
     category_tree_df = (
-        pl.read_csv(input_path / 'category_tree.csv', schema=df_schema, low_memory=True)
+        pl.read_csv(input_path / 'category_tree.csv', schema=CATEGORY_TREE_SCHEMA, low_memory=True)
     )
 
     # item categories
-    # we keep timestamp since there is possibility that the category changes over time
-    df_schema = {"timestamp": pl.UInt64, "itemid": pl.UInt32, "property": pl.Utf8, "value": pl.Utf8}
-    item_categories_df = (
-        pl.concat([
-            pl.read_csv(input_path / 'item_properties_part1.csv', schema=df_schema, low_memory=True),
-            pl.read_csv(input_path / 'item_properties_part2.csv', schema=df_schema, low_memory=True)
-        ])
+    # all item_properties files are read in parallel, skipping files dated outside the train period
+    return (
+        scan_input_files(expand_input_paths(input_path, 'item_properties*'), ITEM_PROPERTIES_SCHEMA,
+                         train_start, test_start)
+        .collect()
         # Convert timestamp to seconds and cast to UInt32 to save memory
         .with_columns((pl.col("timestamp") // 1000).cast(pl.UInt32))
         # Filter all but categoryid
@@ -53,6 +59,17 @@ def main(train_set_path: Path, input_path: Path, output_path: Path, train_weeks:
         .sort(["itemid", "categoryid", "parentid"])
     )
 
+
+@beartype
+def main(train_set_path: Path, input_path: Path, output_path: Path, train_weeks: int, test_weeks: int):
+
+    max_ts = get_max_ts(train_set_path)
+    test_start = max_ts - test_weeks*7*24*60*60
+    train_start = test_start - train_weeks*7*24*60*60
+
+    print("Reading the dataset")
+    item_categories_df = create_item_categories(input_path, train_start, test_start)
+
     print("Saving the datasets")
     train_set_file = output_path / "item_categories.csv"
     item_categories_df.write_csv(train_set_file)
@@ -60,12 +77,17 @@ def main(train_set_path: Path, input_path: Path, output_path: Path, train_weeks:
     print("Done")
 
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
+@beartype
+def cli(argv: list[str] | None = None, prog: str | None = None):
+    parser = argparse.ArgumentParser(prog=prog)
     parser.add_argument('--train-set-path', type=Path, required=True)
     parser.add_argument('--input-path', type=Path, required=True)
     parser.add_argument('--output-path', type=Path, required=True)
     parser.add_argument('--train-weeks', type=int, default=3)
     parser.add_argument('--test-weeks', type=int, default=2)
-    args = parser.parse_args()
-    main(args.train_set_path, args.input_path, args.output_path, args.train_weeks, args.test_weeks)
\ No newline at end of file
+    args = parser.parse_args(argv)
+    main(args.train_set_path, args.input_path, args.output_path, args.train_weeks, args.test_weeks)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,152 @@
+from pathlib import Path
+
+import polars as pl
+from beartype import beartype
+
+from src.data_generation.input_files import expand_input_paths, scan_input_files
+
+EVENT_TYPES = ["view", "addtocart", "transaction"]
+
+# Enum keeps the event as a small integer code in memory and in Parquet files
+EVENT_ENUM = pl.Enum(EVENT_TYPES)
+
+COMPACT_SESSIONS_SCHEMA = {"timestamp": pl.UInt32, "event": EVENT_ENUM, "itemid": pl.UInt32, "session": pl.UInt32}
+
+# Columns added by collapse_repeated_events, a collapsed row stands for repeats events up to last_timestamp
+COLLAPSED_COLUMNS = ["last_timestamp", "repeats"]
+
+# Lines of test_sessions.jsonl written by testset_labels
+TEST_SESSIONS_SCHEMA = {
+    "session": pl.UInt32,
+    "events": pl.List(pl.Struct({"itemid": pl.UInt32, "timestamp": pl.UInt32, "event": pl.String}))
+}
+
+
+@beartype
+def encode_itemids(events_df: pl.DataFrame, output_path: Path):
+    """
+    Convert the itemid column to UInt32
+    Numeric item ids are cast directly. Otherwise the item ids are replaced with dictionary codes and the dictionary is
+    saved to item_dictionary.csv so that the codes can be mapped back to the original item ids. An existing dictionary
+    is kept and only new item ids are appended, so codes stay stable across runs.
+    """
+
+    try:
+        return events_df.with_columns(pl.col("itemid").cast(pl.UInt32, strict=True))
+    except pl.exceptions.InvalidOperationError:
+        pass
+
+    dictionary_file = output_path / "item_dictionary.csv"
+    if dictionary_file.exists():
+        item_dictionary = pl.read_csv(dictionary_file, schema={"code": pl.UInt32, "itemid": pl.String})
+    else:
+        item_dictionary = pl.DataFrame(schema={"code": pl.UInt32, "itemid": pl.String})
+
+    new_items = (
+        events_df
+        .select(pl.col("itemid").cast(pl.String).unique().sort())
+        .join(item_dictionary, on="itemid", how="anti")
+        .with_row_index("code", offset=item_dictionary.height)
+        .with_columns(pl.col("code").cast(pl.UInt32))
+    )
+    if new_items.height > 0:
+        item_dictionary = pl.concat([item_dictionary, new_items])
+        tmp_dictionary_file = output_path / "item_dictionary.csv.tmp"
+        item_dictionary.write_csv(tmp_dictionary_file)
+        tmp_dictionary_file.replace(dictionary_file)
+
+    return (
+        events_df
+        .with_columns(pl.col("itemid").cast(pl.String))
+        .join(item_dictionary, on="itemid", how="left", maintain_order="left")
+        .with_columns(itemid=pl.col("code"))
+        .drop("code")
+    )
+
+
+@beartype
+def to_compact_schema(sessions_df: pl.DataFrame):
+    """
+    Cast sessionized events to the compact schema
+    """
+
+    return sessions_df.with_columns(
+        [pl.col(column).cast(dtype) for column, dtype in COMPACT_SESSIONS_SCHEMA.items() if column in sessions_df.columns]
+    )
+
+
+@beartype
+def read_sessions(path: Path, columns: list[str] | None = None):
+    """
+    Read a sessionized dataset written as CSV or, in the compact schema, as Parquet
+    The path can also be a directory or glob pattern of partition files, which are read in parallel.
+    """
+
+    if path.is_file() and path.suffix == ".parquet":
+        return pl.read_parquet(path, columns=columns)
+    if path.is_file():
+        return pl.read_csv(path, columns=columns, low_memory=True)
+    lazy_df = scan_input_files(expand_input_paths(path, "**/*"))
+    return (lazy_df.select(columns) if columns is not None else lazy_df).collect()
+
+
+@beartype
+def session_columns(path: Path):
+    """
+    Column names of a sessionized dataset, without reading its rows
+    """
+
+    if path.is_file() and path.suffix == ".parquet":
+        return pl.scan_parquet(path).collect_schema().names()
+    if path.is_file():
+        return pl.scan_csv(path).collect_schema().names()
+    return scan_input_files(expand_input_paths(path, "**/*")).collect_schema().names()
+
+
+@beartype
+def event_count(columns: list[str]):
+    """
+    Number of events of a row, more than one for the rows of collapse_repeated_events
+    """
+
+    return pl.col("repeats") if "repeats" in columns else pl.ones(pl.len(), dtype=pl.UInt32)
+
+
+@beartype
+def last_event_timestamp(columns: list[str]):
+    """
+    Timestamp of the last event of a row, the last repeat for the rows of collapse_repeated_events
+    """
+
+    return pl.col("last_timestamp") if "last_timestamp" in columns else pl.col("timestamp")
+
+
+@beartype
+def sessions_file(directory: Path, name: str):
+    """
+    Path of a sessionized dataset in the directory, preferring the partitioned dataset and then the compact Parquet
+    file when they exist
+    """
+
+    partitioned = directory / name
+    if partitioned.is_dir():
+        return partitioned
+    parquet_file = directory / f"{name}.parquet"
+    if parquet_file.exists():
+        return parquet_file
+    return directory / f"{name}.csv"
+
+
+@beartype
+def read_test_sessions(path: Path):
+    """
+    Read the events of test_sessions.jsonl as a sessionized dataset, one row per event
+    """
+
+    return (
+        pl.scan_ndjson(path, schema=TEST_SESSIONS_SCHEMA)
+        .explode("events")
+        .unnest("events")
+        .select("timestamp", "event", "itemid", "session")
+        .collect()
+    )
@@ -0,0 +1,192 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+from beartype import beartype
+from tqdm.auto import tqdm
+
+from src.data_generation.schema import EVENT_TYPES
+
+
+@beartype
+def zipf_cdf(num_items: int, exponent: float):
+    """
+    Cumulative probabilities of the popularity ranks of the items
+    """
+    probabilities = 1 / np.arange(1, num_items + 1) ** exponent
+    return np.cumsum(probabilities / probabilities.sum())
+
+
+@beartype
+def generate_gaps(rng: np.random.Generator, size: int):
+    """
+    Seconds between subsequent events of a visitor
+    Mostly short gaps inside a session, some gaps close to the 30 minute session boundary on both sides and some long
+    gaps between sessions.
+    """
+    kind = rng.choice(3, size=size, p=[0.85, 0.05, 0.10])
+    return np.select(
+        [kind == 0, kind == 1],
+        [rng.exponential(60, size=size), rng.uniform(25 * 60, 35 * 60, size=size)],
+        rng.exponential(2 * 24 * 60 * 60, size=size) + 30 * 60,
+    ).astype(np.int64)
+
+
+@beartype
+def generate_events_chunk(rng: np.random.Generator, first_visitorid: int, num_visitors: int,
+                          item_cdf: np.ndarray, item_order: np.ndarray, start_ts: int, end_ts: int,
+                          first_transactionid: int, mean_events_per_visitor: float):
+    """
+    Events of num_visitors visitors in the events.csv schema, with timestamps in milliseconds
+    """
+    visitor_events = rng.geometric(1 / mean_events_per_visitor, size=num_visitors)
+    num_events = int(visitor_events.sum())
+    visitorid = np.repeat(np.arange(first_visitorid, first_visitorid + num_visitors), visitor_events)
+
+    # Cumulative gaps restarting from the first event of every visitor
+    gaps = generate_gaps(rng, num_events)
+    first_event = np.cumsum(visitor_events) - visitor_events
+    gaps[first_event] = 0
+    elapsed = np.cumsum(gaps)
+    elapsed -= np.repeat(elapsed[first_event], visitor_events)
+    visitor_start = rng.integers(start_ts, end_ts, size=num_visitors)
+    timestamp = np.repeat(visitor_start, visitor_events) + elapsed
+
+    # Popular items are sampled more often, the popularity rank is shuffled over the item ids
+    itemid = item_order[np.searchsorted(item_cdf, rng.random(num_events), side="right").clip(max=len(item_cdf) - 1)]
+    event_codes = rng.choice(3, size=num_events, p=[0.96, 0.03, 0.01])
+    is_transaction = event_codes == 2
+
+    events_df = pl.DataFrame({
+        "timestamp": timestamp * 1000 + rng.integers(0, 1000, size=num_events),
+        "visitorid": visitorid,
+        "event": np.array(EVENT_TYPES)[event_codes],
+        "itemid": itemid,
+        "is_transaction": is_transaction,
+    }).with_columns(
+        # Transaction ids only for the transaction events
+        transactionid=pl.when(pl.col("is_transaction"))
+        .then(pl.col("is_transaction").cum_sum() + first_transactionid - 1)
+        .cast(pl.UInt32)
+    ).drop("is_transaction").filter(pl.col("timestamp") < end_ts * 1000)
+    return events_df, first_transactionid + int(is_transaction.sum())
+
+
+@beartype
+def write_events(output_path: Path, num_events: int, num_items: int, start_ts: int, end_ts: int,
+                 zipf_exponent: float, seed: int, chunk_size: int, mean_events_per_visitor: float = 20.):
+    """
+    Stream events.csv to disk in chunks of about chunk_size events
+    """
+    rng = np.random.default_rng(seed)
+    item_cdf = zipf_cdf(num_items, zipf_exponent)
+    item_order = rng.permutation(num_items)
+
+    written = 0
+    first_visitorid = 0
+    first_transactionid = 0
+    with open(output_path / "events.csv", "wb") as f, tqdm(total=num_events, desc="Generating events") as progress:
+        while written < num_events:
+            num_visitors = max(1, int(min(chunk_size, num_events - written) / mean_events_per_visitor))
+            events_df, first_transactionid = generate_events_chunk(
+                rng, first_visitorid, num_visitors, item_cdf, item_order, start_ts, end_ts,
+                first_transactionid, mean_events_per_visitor)
+            events_df = events_df.head(num_events - written)
+            events_df.write_csv(f, include_header=written == 0)
+            written += events_df.height
+            first_visitorid += num_visitors
+            progress.update(events_df.height)
+
+
+@beartype
+def generate_category_tree(rng: np.random.Generator, num_categories: int, num_root_categories: int):
+    """
+    Categories with a parent among the categories with smaller ids, the first categories have no parent
+    """
+    categoryid = np.arange(num_categories)
+    parentid = np.where(categoryid < num_root_categories, -1, (rng.random(num_categories) * categoryid).astype(np.int64))
+    return (
+        pl.DataFrame({"categoryid": categoryid, "parentid": parentid})
+        .with_columns(parentid=pl.when(pl.col("parentid") >= 0).then(pl.col("parentid")).cast(pl.UInt32))
+    )
+
+
+@beartype
+def generate_item_properties_chunk(rng: np.random.Generator, itemids: np.ndarray, num_categories: int, start_ts: int,
+                                   end_ts: int, category_change_probability: float):
+    """
+    Weekly snapshots of the categoryid and availability properties of the items in the item_properties schema
+    An item changes its category between snapshots with category_change_probability.
+    """
+    snapshots = np.arange(start_ts, end_ts, 7 * 24 * 60 * 60)
+    num_items = len(itemids)
+
+    categories = np.empty((len(snapshots), num_items), dtype=np.int64)
+    categories[0] = rng.integers(0, num_categories, size=num_items)
+    for snapshot in range(1, len(snapshots)):
+        changes = rng.random(num_items) < category_change_probability
+        categories[snapshot] = np.where(changes, rng.integers(0, num_categories, size=num_items),
+                                        categories[snapshot - 1])
+
+    timestamp = (np.repeat(snapshots, num_items) + rng.integers(0, 24 * 60 * 60, size=len(snapshots) * num_items))
+    category_df = pl.DataFrame({
+        "timestamp": timestamp * 1000,
+        "itemid": np.tile(itemids, len(snapshots)),
+        "property": "categoryid",
+        "value": categories.ravel().astype(str),
+    })
+    available_df = category_df.with_columns(
+        property=pl.lit("available"),
+        value=pl.Series(rng.integers(0, 2, size=category_df.height).astype(str)),
+    )
+    return pl.concat([category_df, available_df])
+
+
+@beartype
+def write_item_properties(output_path: Path, num_items: int, num_categories: int, start_ts: int, end_ts: int,
+                          category_change_probability: float, seed: int, chunk_size: int):
+    """
+    Stream the item properties to item_properties_part1.csv and item_properties_part2.csv, half of the items each
+    """
+    rng = np.random.default_rng(seed + 1)
+    parts = np.array_split(np.arange(num_items), 2)
+    for part, part_itemids in enumerate(parts, start=1):
+        with open(output_path / f"item_properties_part{part}.csv", "wb") as f:
+            for chunk_start in tqdm(range(0, len(part_itemids), chunk_size), desc=f"Generating item properties {part}"):
+                generate_item_properties_chunk(
+                    rng, part_itemids[chunk_start:chunk_start + chunk_size], num_categories, start_ts, end_ts,
+                    category_change_probability
+                ).write_csv(f, include_header=chunk_start == 0)
+
+
+@beartype
+def main(output_path: Path, num_events: int, num_items: int, num_categories: int, weeks: int, zipf_exponent: float,
+         category_change_probability: float, seed: int, chunk_size: int):
+    # Same start as the Retailrocket dataset
+    start_ts = 1430622000
+    end_ts = start_ts + weeks * 7 * 24 * 60 * 60
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    write_events(output_path, num_events, num_items, start_ts, end_ts, zipf_exponent, seed, chunk_size)
+    write_item_properties(output_path, num_items, num_categories, start_ts, end_ts, category_change_probability, seed,
+                          max(1, chunk_size // (2 * weeks)))
+    generate_category_tree(np.random.default_rng(seed + 2), num_categories, max(1, num_categories // 40)).write_csv(
+        output_path / "category_tree.csv")
+    print("Done")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output-path', type=Path, required=True)
+    parser.add_argument('--num-events', type=int, default=2_756_101)
+    parser.add_argument('--num-items', type=int, default=235_061)
+    parser.add_argument('--num-categories', type=int, default=1669)
+    parser.add_argument('--weeks', type=int, default=20)
+    parser.add_argument('--zipf-exponent', type=float, default=1.1)
+    parser.add_argument('--category-change-probability', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=5_000_000, help='Number of events generated at a time')
+    args = parser.parse_args()
+    main(args.output_path, args.num_events, args.num_items, args.num_categories, args.weeks, args.zipf_exponent,
+         args.category_change_probability, args.seed, args.chunk_size)
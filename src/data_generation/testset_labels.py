@@ -1,13 +1,22 @@
 import argparse
 import json
+import multiprocessing
 import random
-from copy import deepcopy
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
+from typing import TextIO
 
 import polars as pl
 from beartype import beartype
 from tqdm.auto import tqdm
 
+from src.data_generation.schema import read_sessions
+
+# Labels of every split point written with all_prefixes
+PREFIX_LABELS_FILE = 'prefix_labels.parquet'
+
 
 class setEncoder(json.JSONEncoder):
 
@@ -34,68 +43,251 @@ def ground_truth(events: list[dict]):
     return events[:-1]
 
 
+@beartype
+def suffix_labels(events: list[dict], split_idx: int):
+    """
+    Labels of a split point: the items added to cart or purchased at or after split_idx
+    Same as the labels ground_truth gives to the event before split_idx, without computing them for every event
+    """
+    labels = {}
+    for event in events[split_idx:]:
+        if event["event"] in ("addtocart", "transaction"):
+            labels.setdefault(event["event"], set()).add(event["itemid"])
+    return labels
+
+
 @beartype
 def split_events(events: list[dict], split_idx: int | None = None):
-    test_events = ground_truth(deepcopy(events))
     # Make sure that there will be addtocart or transaction event in the test set
     if split_idx is None:
-        last_possible_idx = 0
-        for i, event in enumerate(test_events):
-            if event['labels']:
-                last_possible_idx = i
+        # The last event with labels is the one before the last addtocart or transaction event
+        last_label_idx = max(
+            (i for i, event in enumerate(events) if event["event"] in ("addtocart", "transaction")), default=0)
+        last_possible_idx = max(last_label_idx - 1, 0)
         split_idx = 1
         if last_possible_idx != 0:
             split_idx = random.randint(1, last_possible_idx)
 
-    test_events = test_events[:split_idx]
-    labels = test_events[-1]['labels']
-    for event in test_events:
-        del event['labels']
+    # The last event is never in the test events
+    split_idx = min(split_idx, len(events) - 1)
+    test_events = [dict(event) for event in events[:split_idx]]
+    labels = suffix_labels(events, split_idx)
     return test_events, labels
 
 
 @beartype
-def split_test_set(sessions: pl.DataFrame, sessions_output: Path, labels_output: Path):
-    last_labels = []
-    splitted_sessions = []
-
-    sessions = sessions.rows()
-    for session_id, events in tqdm(sessions, desc="Creating trimmed testset", total=len(sessions)):
+def split_sessions(sessions: Iterable[tuple], sessions_file: TextIO, labels_file: TextIO):
+    for session_id, events in sessions:
         if len(events) < 2:
             continue
         splitted_events, labels = split_events(events)
-        last_labels.append({'session': session_id, 'labels': labels})
-        splitted_sessions.append({'session': session_id, 'events': splitted_events})
+        sessions_file.write(json.dumps({'session': session_id, 'events': splitted_events}) + '\n')
+        labels_file.write(json.dumps({'session': session_id, 'labels': labels}, cls=setEncoder) + '\n')
+
+
+@beartype
+def split_test_set(sessions: pl.DataFrame, sessions_output: Path, labels_output: Path):
+    sessions = sessions.rows()
+    with open(sessions_output, 'w') as sessions_file, open(labels_output, 'w') as labels_file:
+        split_sessions(
+            tqdm(sessions, desc="Creating trimmed testset", total=len(sessions)), sessions_file, labels_file)
 
-    with open(sessions_output, 'w') as f:
-        for session in splitted_sessions:
-            f.write(json.dumps(session) + '\n')
 
-    with open(labels_output, 'w') as f:
-        for label in last_labels:
-            f.write(json.dumps(label, cls=setEncoder) + '\n')
+@beartype
+def squeeze_sessions(test_df: pl.DataFrame):
+    """
+    Squeeze the events of each session into a single row
+    """
+    return (
+        test_df
+        .select("session", pl.struct("itemid", "timestamp", "event").alias("events"))
+        .group_by("session", maintain_order=True)
+        .agg(pl.col("events"))
+    )
 
 
 @beartype
-def main(test_set: Path, output_path: Path, seed: int):
+def iter_session_chunks(test_df: pl.DataFrame, chunk_size: int):
+    """
+    Slice a test set sorted by session and timestamp into chunks of chunk_size sessions
+    Sessions are contiguous in the sorted test set, so the chunks are zero-copy slices between session boundaries.
+    """
+    session_ends = test_df.select(pl.col("session").rle().struct.field("len").cum_sum()).to_series()
+    chunk_ends = session_ends.gather_every(chunk_size, offset=chunk_size - 1).to_list()
+    if not chunk_ends or chunk_ends[-1] != test_df.height:
+        chunk_ends.append(test_df.height)
+
+    chunk_start = 0
+    for chunk_end in chunk_ends:
+        yield test_df.slice(chunk_start, chunk_end - chunk_start)
+        chunk_start = chunk_end
+
+
+@beartype
+def split_test_set_chunked(test_df: pl.DataFrame, sessions_output: Path, labels_output: Path, chunk_size: int):
+    """
+    Split the test set converting only chunk_size sessions at a time to Python objects
+    """
+    num_chunks = -(-test_df.select(pl.col("session").n_unique()).item() // chunk_size)
+    with open(sessions_output, 'w') as sessions_file, open(labels_output, 'w') as labels_file:
+        for chunk_df in tqdm(iter_session_chunks(test_df, chunk_size), desc="Creating trimmed testset",
+                             total=num_chunks):
+            split_sessions(squeeze_sessions(chunk_df).rows(), sessions_file, labels_file)
+
+
+@beartype
+def prefix_labels(events: list[dict]):
+    """
+    Labels of every split point of a session from one reverse pass over its events
+    Returns (prefix_length, addtocart items, transaction items) of the split points with labels, the same labels
+    split_events gives to a split at prefix_length. The sorted label lists are only rebuilt when an event adds a new
+    label, the split points in between share them, so long sessions are not quadratic in the number of events.
+    """
+    labels = {"addtocart": set(), "transaction": set()}
+    sorted_labels = {"addtocart": [], "transaction": []}
+    rows = []
+    for prefix_length in range(len(events) - 1, 0, -1):
+        event = events[prefix_length]
+        event_labels = labels.get(event["event"])
+        if event_labels is not None and event["itemid"] not in event_labels:
+            event_labels.add(event["itemid"])
+            sorted_labels[event["event"]] = sorted(event_labels)
+        if sorted_labels["addtocart"] or sorted_labels["transaction"]:
+            rows.append((prefix_length, sorted_labels["addtocart"], sorted_labels["transaction"]))
+    rows.reverse()
+    return rows
+
+
+@beartype
+def split_all_prefixes(test_df: pl.DataFrame, sessions_output: Path, labels_output: Path, chunk_size: int):
+    """
+    Write every session with labels once to sessions_output and the labels of all its split points to the Parquet
+    file labels_output, one (session, prefix_length, addtocart, transaction) row per split point
+    The test sessions of a split point are the first prefix_length events of the session.
+    """
+    schema = {"session": test_df.schema["session"], "prefix_length": pl.UInt32,
+              "addtocart": pl.List(test_df.schema["itemid"]), "transaction": pl.List(test_df.schema["itemid"])}
+    num_chunks = -(-test_df.select(pl.col("session").n_unique()).item() // chunk_size)
+    labels_dfs = []
+    with open(sessions_output, 'w') as sessions_file:
+        for chunk_df in tqdm(iter_session_chunks(test_df, chunk_size), desc="Labelling all prefixes",
+                             total=num_chunks):
+            rows = []
+            for session_id, events in squeeze_sessions(chunk_df).rows():
+                session_rows = prefix_labels(events)
+                if not session_rows:
+                    continue
+                sessions_file.write(json.dumps({'session': session_id, 'events': events}) + '\n')
+                rows.extend((session_id, *row) for row in session_rows)
+            labels_dfs.append(pl.DataFrame(rows, schema=schema, orient="row"))
+    pl.concat(labels_dfs or [pl.DataFrame(schema=schema)]).write_parquet(labels_output)
+
+
+@beartype
+def list_partitions(test_set: Path):
+    """
+    Hive partition directories (key=value) of a partitioned test set, empty for a test set file
+    """
+    if not test_set.is_dir():
+        return []
+    return sorted(path for path in test_set.iterdir() if path.is_dir() and "=" in path.name)
+
+
+@beartype
+def split_partition(partition: Path, output_path: Path, seed: int, chunk_size: int | None = None,
+                    all_prefixes: bool = False):
+    """
+    Split the sessions of one test set partition into output_path/<partition>/test_sessions.jsonl and test_labels.jsonl
+    The random split points depend only on the seed and the partition, not on the other partitions.
+    """
+    random.seed(f"{seed}/{partition.name}")
+    partition_output = output_path / partition.name
+    partition_output.mkdir(parents=True, exist_ok=True)
+    test_df = read_sessions(partition).sort(["session", "timestamp"], maintain_order=True)
+    if all_prefixes:
+        split_all_prefixes(test_df, partition_output / 'test_sessions.jsonl', partition_output / PREFIX_LABELS_FILE,
+                           chunk_size or max(test_df.height, 1))
+        return
+    split_test_set_chunked(test_df, partition_output / 'test_sessions.jsonl', partition_output / 'test_labels.jsonl',
+                           chunk_size or max(test_df.height, 1))
+
+
+@beartype
+def main(test_set: Path, output_path: Path, seed: int, chunk_size: int | None = None,
+         partitions: list[str] | None = None, workers: int = 1, all_prefixes: bool = False):
+    partition_paths = list_partitions(test_set)
+    if partition_paths:
+        if partitions is not None:
+            unknown = set(partitions) - {path.name for path in partition_paths}
+            if unknown:
+                raise ValueError(f"Unknown partitions {sorted(unknown)} of {test_set}")
+            partition_paths = [path for path in partition_paths if path.name in partitions]
+        if workers == 1:
+            for partition in partition_paths:
+                split_partition(partition, output_path, seed, chunk_size, all_prefixes)
+            return
+        # polars is not fork safe, so the workers are spawned
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            list(executor.map(split_partition, partition_paths, repeat(output_path), repeat(seed), repeat(chunk_size),
+                              repeat(all_prefixes)))
+        return
+    if partitions is not None:
+        raise ValueError(f"{test_set} is not a partitioned test set")
+
+    split_test_df(read_sessions(test_set), output_path, seed, chunk_size, all_prefixes)
+
+
+@beartype
+def split_test_df(test_df: pl.DataFrame, output_path: Path, seed: int, chunk_size: int | None = None,
+                  all_prefixes: bool = False):
+    """
+    Split the sessions of a test set into output_path/test_sessions.jsonl and test_labels.jsonl
+    With all_prefixes the whole sessions are written once and the labels of all split points to prefix_labels.parquet.
+    """
+    if all_prefixes:
+        test_df = test_df.sort(["session", "timestamp"], maintain_order=True)
+        split_all_prefixes(test_df, output_path / 'test_sessions.jsonl', output_path / PREFIX_LABELS_FILE,
+                           chunk_size or max(test_df.height, 1))
+        return
     random.seed(seed)
-    # read test set and squeeze session events into a single row
+    test_sessions_file = output_path / 'test_sessions.jsonl'
+    test_labels_file = output_path / 'test_labels.jsonl'
+
+    if chunk_size is not None:
+        test_df = test_df.sort(["session", "timestamp"], maintain_order=True)
+        split_test_set_chunked(test_df, test_sessions_file, test_labels_file, chunk_size)
+        return
+
+    # squeeze session events into a single row
     test_sessions = (
-        pl.read_csv(test_set)
+        test_df
         .sort(["session", "timestamp"])
         .select("session", pl.struct("itemid", "timestamp", "event").alias("events"))
         .group_by("session")
         .agg(pl.col("events"))
     )
-    test_sessions_file = output_path / 'test_sessions.jsonl'
-    test_labels_file = output_path / 'test_labels.jsonl'
     split_test_set(test_sessions, test_sessions_file, test_labels_file)
 
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--test-set', type=Path, required=True)
+@beartype
+def cli(argv: list[str] | None = None, prog: str | None = None):
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--test-set', type=Path, required=True,
+                        help='test_set.csv, compact test_set.parquet or directory of test set files')
     parser.add_argument('--output-path', type=Path, required=True)
     parser.add_argument('--seed', type=int, default=42)
-    args = parser.parse_args()
-    main(args.test_set, args.output_path, args.seed)
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='Convert the sessions to Python objects in chunks of this many sessions')
+    parser.add_argument('--partitions', type=str, nargs='+', default=None,
+                        help='Split only these partitions (e.g. bucket=3) of a hive partitioned test set')
+    parser.add_argument('--workers', type=int, default=1, help='Number of partitions split in parallel')
+    parser.add_argument('--all-prefixes', action='store_true',
+                        help=f'Label every split point of the sessions in {PREFIX_LABELS_FILE} instead of one random '
+                             'split point')
+    args = parser.parse_args(argv)
+    main(args.test_set, args.output_path, args.seed, args.chunk_size, args.partitions, args.workers,
+         args.all_prefixes)
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,8 +1,20 @@
+import numpy as np
 import polars as pl
 import argparse
+import math
+import os
+import resource
+import sys
+import tempfile
 from pathlib import Path
 from beartype import beartype
 
+from src.data_generation.input_files import date_timestamp, expand_input_paths, scan_input_files
+from src.data_generation.schema import EVENT_ENUM, encode_itemids, to_compact_schema
+from src.output_files import replace_directory, temporary_directory
+
+EVENTS_SCHEMA = {"timestamp": pl.UInt64, "visitorid": pl.UInt32, "event": pl.Utf8, "itemid": pl.Utf8, "transactionid": pl.UInt32}
+
 @beartype
 def create_sessions(events_df: pl.DataFrame):
     """
@@ -41,18 +53,257 @@ def create_sessions(events_df: pl.DataFrame):
 
 
 @beartype
-def create_train_test_split(sessions_df: pl.DataFrame, train_weeks: int, test_weeks: int):
+def collapse_repeated_events(sessions_df: pl.DataFrame):
     """
-    Train test split
+    Collapse consecutive events of a session with the same item and event type into one event
+    The collapsed event keeps the first timestamp, and the last timestamp and the number of repeats are added as the
+    last_timestamp and repeats columns. The sessions must be sorted by session and timestamp.
     """
 
-    max_ts = (
+    return (
         sessions_df
-        .select("timestamp")
-        .max()
-        .item()
+        .with_columns(run=pl.struct("session", "itemid", "event").rle_id())
+        .group_by("run", maintain_order=True)
+        .agg(
+            pl.col("timestamp").first(),
+            pl.col("event").first(),
+            pl.col("itemid").first(),
+            pl.col("session").first(),
+            last_timestamp=pl.col("timestamp").last(),
+            repeats=pl.len().cast(pl.UInt32),
+        )
+        .drop("run")
     )
 
+
+# What to do with the events of a heavy visitor: drop all of them or keep only the first max_visitor_events
+HEAVY_VISITOR_ACTIONS = ["drop", "cap"]
+
+
+class CountMinSketch:
+    """
+    Count-min sketch of the number of events of every visitor, for counting a stream of event batches in fixed memory
+    The estimates are never below the true counts. They exceed them by at most e / width of all counted events with
+    probability 1 - e^-depth.
+    """
+
+    def __init__(self, width: int = 2**20, depth: int = 4, table: np.ndarray | None = None):
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.uint32)
+        # Odd multipliers of the multiplicative hashes of the rows
+        self.multipliers = np.random.default_rng(0).integers(1, 2**32, self.table.shape[0], dtype=np.uint64) | 1
+
+    def buckets(self, visitorids: np.ndarray):
+        # High bits of the 32 bit multiplicative hashes, the low bits would repeat for visitor ids a power of 2 apart
+        hashes = visitorids.astype(np.uint64)[None, :] * self.multipliers[:, None] % 2**32
+        return (hashes * np.uint64(self.table.shape[1]) // 2**32).astype(np.int64)
+
+    def add(self, visitorids: np.ndarray, counts: np.ndarray):
+        for row, buckets in enumerate(self.buckets(visitorids)):
+            self.table[row] += np.bincount(buckets, weights=counts, minlength=self.table.shape[1]).astype(np.uint32)
+
+    def estimate(self, visitorids: np.ndarray):
+        buckets = self.buckets(visitorids)
+        return self.table[np.arange(len(buckets))[:, None], buckets].min(axis=0)
+
+    def save(self, path: Path):
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.table)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path):
+        return cls(table=np.load(path))
+
+
+@beartype
+def filter_heavy_visitors(events_df: pl.DataFrame, max_visitor_events: int, action: str = "drop",
+                          sketch: CountMinSketch | None = None):
+    """
+    Drop the events of visitors with more than max_visitor_events events, or cap them to their first
+    max_visitor_events events, before the events are sorted for sessionization
+    The events of the visitors are counted in one group by pass. With a sketch, the counts of the earlier batches of a
+    stream are estimated from the sketch, which is updated with the batch.
+    Returns the remaining events, the number of removed events and the number of heavy visitors
+    """
+
+    if action not in HEAVY_VISITOR_ACTIONS:
+        raise ValueError(f"Unknown heavy visitor action {action}")
+    counts_df = events_df.group_by("visitorid").agg(count=pl.len().cast(pl.Int64))
+    previous = np.zeros(counts_df.height, dtype=np.int64)
+    if sketch is not None:
+        visitorids = counts_df.get_column("visitorid").to_numpy()
+        previous = sketch.estimate(visitorids).astype(np.int64)
+        sketch.add(visitorids, counts_df.get_column("count").to_numpy())
+    heavy_df = (
+        counts_df
+        .with_columns(previous=pl.Series(previous))
+        .filter(pl.col("previous") + pl.col("count") > max_visitor_events)
+    )
+
+    is_heavy = pl.col("visitorid").is_in(heavy_df.get_column("visitorid").implode())
+    if action == "drop":
+        filtered_df = events_df.filter(~is_heavy)
+    else:
+        # Only the events of the heavy visitors are sorted to find their first events
+        capped_df = (
+            events_df
+            .filter(is_heavy)
+            .join(heavy_df.select("visitorid", allowed=max_visitor_events - pl.col("previous")), on="visitorid")
+            .sort(["visitorid", "timestamp"], maintain_order=True)
+            .filter(pl.int_range(pl.len()).over("visitorid") < pl.col("allowed"))
+            .drop("allowed")
+        )
+        filtered_df = pl.concat([events_df.filter(~is_heavy), capped_df])
+    return filtered_df, events_df.height - filtered_df.height, heavy_df.height
+
+
+@beartype
+def continue_sessions(events_df: pl.DataFrame, state_df: pl.DataFrame):
+    """
+    Form sessions for a new batch of events, continuing the open sessions of the boundary state
+    The boundary state holds the last timestamp and the latest session id of every visitor seen so far. The first
+    event of a visitor continues that session if it is less than 30 minutes after the last timestamp, otherwise the
+    same rules as in create_sessions apply. Sessions with only 1 event are kept, since they may continue later.
+    """
+
+    next_session = (state_df.select("session").max().item() or 0) + 1
+
+    sessions_df = (
+        events_df
+        .sort(["visitorid", "timestamp"], descending=[False, False])
+        .join(
+            state_df.rename({"timestamp": "last_timestamp", "session": "open_session"}),
+            on="visitorid", how="left", maintain_order="left"
+        )
+    )
+
+    if sessions_df.filter(pl.col("timestamp") < pl.col("last_timestamp")).height > 0:
+        raise ValueError("New events must not be older than the last event of the same visitor in the boundary state")
+
+    sessions_df = (
+        sessions_df
+        .with_columns(
+            is_first_event=pl.col("visitorid").ne_missing(pl.col("visitorid").shift(1)),
+            previous_timestamp=pl.col("timestamp").shift(1),
+        )
+        .with_columns(
+            previous_timestamp=pl.when(pl.col("is_first_event")).then(pl.col("last_timestamp"))
+            .otherwise(pl.col("previous_timestamp"))
+        )
+        .with_columns(
+            is_session_boundary=(
+                pl.col("previous_timestamp").is_null()
+                | ((pl.col("timestamp") - pl.col("previous_timestamp")) >= 30 * 60)
+            )
+        )
+        # New sessions get ids after the largest id of the state, continued sessions keep their open session id
+        .with_columns(
+            session=pl.when(pl.col("is_session_boundary"))
+            .then(pl.col("is_session_boundary").cum_sum() + next_session - 1)
+            .when(pl.col("is_first_event"))
+            .then(pl.col("open_session"))
+            .otherwise(None)
+            .forward_fill()
+            .cast(pl.UInt32)
+        )
+    )
+
+    updated_state_df = pl.concat([
+        state_df.join(sessions_df.select("visitorid").unique(), on="visitorid", how="anti"),
+        sessions_df
+        .group_by("visitorid")
+        .agg(pl.col("timestamp").last(), pl.col("session").last())
+        .select(state_df.columns)
+        .cast(state_df.schema)
+    ])
+
+    sessions_df = sessions_df.drop([
+        "visitorid", "transactionid", "last_timestamp", "open_session", "is_first_event", "previous_timestamp",
+        "is_session_boundary"
+    ])
+
+    return sessions_df, updated_state_df
+
+
+@beartype
+def append_to_session_store(events_df: pl.DataFrame, store_path: Path):
+    """
+    Sessionize a new batch of events and append it to a session store partitioned by day
+    The store contains the boundary state of the visitors (state.parquet) and one directory per day
+    (day=YYYY-MM-DD) with a part file for every appended batch, so only the new events are processed.
+    The state records the number of appended batches and is replaced last, so parts of a failed append are ignored
+    and overwritten by the next append.
+    """
+
+    state_file = store_path / "state.parquet"
+    if state_file.exists():
+        state_df = pl.read_parquet(state_file)
+        batch = session_store_batches(store_path)
+    else:
+        state_df = pl.DataFrame(schema={"visitorid": pl.UInt32, "timestamp": pl.UInt32, "session": pl.UInt32})
+        batch = 0
+
+    sessions_df, state_df = continue_sessions(events_df, state_df)
+
+    for part_file in store_path.glob(f"day=*/part-{batch}.parquet"):
+        part_file.unlink()
+    sessions_df = sessions_df.with_columns(day=pl.from_epoch("timestamp").dt.date())
+    for (day,), day_df in sessions_df.group_by("day"):
+        partition_path = store_path / f"day={day}"
+        partition_path.mkdir(parents=True, exist_ok=True)
+        day_df.drop("day").sort(["session", "timestamp"]).write_parquet(partition_path / f"part-{batch}.parquet")
+
+    store_path.mkdir(parents=True, exist_ok=True)
+    tmp_state_file = store_path / "state.parquet.tmp"
+    state_df.write_parquet(tmp_state_file, metadata={"batches": str(batch + 1)})
+    os.replace(tmp_state_file, state_file)
+
+    return sessions_df.drop("day")
+
+
+@beartype
+def session_store_batches(store_path: Path):
+    """
+    Number of batches appended to a session store
+    """
+
+    return int(pl.read_parquet_metadata(store_path / "state.parquet").get("batches", 0))
+
+
+@beartype
+def read_session_store(store_path: Path):
+    """
+    Read all sessions of a session store sorted by session and timestamp
+    """
+
+    batches = session_store_batches(store_path)
+    part_files = [
+        part_file for part_file in sorted(store_path.glob("day=*/part-*.parquet"))
+        if int(part_file.stem.removeprefix("part-")) < batches
+    ]
+    return (
+        pl.scan_parquet(part_files, hive_partitioning=False)
+        .sort(["session", "timestamp"], maintain_order=True)
+        .collect()
+    )
+
+
+@beartype
+def create_train_test_split(sessions_df: pl.DataFrame, train_weeks: int, test_weeks: int, max_ts: int | None = None):
+    """
+    Train test split
+    The periods end at max_ts, by default the last timestamp of the sessions.
+    """
+
+    if max_ts is None:
+        max_ts = (
+            sessions_df
+            .select("timestamp")
+            .max()
+            .item()
+        )
+
     # 2 weeks
     test_start = max_ts - test_weeks*7*24*60*60
 
@@ -108,35 +359,312 @@ def create_train_test_split(sessions_df: pl.DataFrame, train_weeks: int, test_we
 
 
 @beartype
-def main(input_path: Path, output_path: Path, train_weeks: int, test_weeks: int):
-    print("Reading the dataset")
-    df_schema = {"timestamp": pl.UInt64, "visitorid": pl.UInt32, "event": pl.Utf8, "itemid": pl.Utf8, "transactionid": pl.UInt32}
-    events_df = (
-        pl.read_csv(input_path, schema=df_schema, low_memory=True)
+def create_train_test_split_contiguous(sessions_df: pl.DataFrame, train_weeks: int, test_weeks: int,
+                                       max_ts: int | None = None):
+    """
+    Train test split for sessions that are sorted by session and timestamp
+    Gives the same train and test sets as create_train_test_split, but the session boundaries are computed once with
+    a run-length id and the per session filters are gathered back to the events by the run id instead of using window
+    expressions and joins.
+    """
+
+    if max_ts is None:
+        max_ts = (
+            sessions_df
+            .select("timestamp")
+            .max()
+            .item()
+        )
+
+    # 2 weeks
+    test_start = max_ts - test_weeks*7*24*60*60
+
+    # 3 weeks
+    train_start = test_start - train_weeks*7*24*60*60
+
+    in_train = (pl.col("timestamp") >= train_start) & (pl.col("timestamp") < test_start)
+    in_test = pl.col("timestamp") >= test_start
+
+    # Run-length id of the session is the position of the session in the session table
+    run_ids = sessions_df.select(pl.col("session").rle_id()).to_series()
+    is_first_event = run_ids.ne_missing(run_ids.shift(1))
+
+    session_stats = (
+        sessions_df
+        .with_columns(run_id=run_ids, is_first_event=is_first_event)
+        .group_by("run_id", maintain_order=True)
+        .agg(
+            # There must be a cart or purchase event after the first event
+            has_cart_or_order=((pl.col("event") != "view") & ~pl.col("is_first_event")).any(),
+            # Sessions with only 1 event in the period are dropped. Sessions are sorted by timestamp, so more than one
+            # event is the same as the first and last timestamp of the period being different
+            train_events=pl.col("timestamp").filter(in_train).min() < pl.col("timestamp").filter(in_train).max(),
+            test_events=pl.col("timestamp").filter(in_test).min() < pl.col("timestamp").filter(in_test).max(),
+        )
+        .select(
+            is_train=pl.col("has_cart_or_order") & pl.col("train_events").fill_null(False),
+            # Sessions in the train dataset are not used in the test dataset
+            is_test=pl.col("has_cart_or_order") & pl.col("test_events").fill_null(False)
+            & ~pl.col("train_events").fill_null(False),
+        )
+    )
+
+    is_train_session = session_stats.get_column("is_train").gather(run_ids)
+    is_test_session = session_stats.get_column("is_test").gather(run_ids)
+
+    train_df = sessions_df.filter(is_train_session & sessions_df.select(in_train).to_series())
+    test_df = sessions_df.filter(is_test_session & sessions_df.select(in_test).to_series())
+
+    return train_df, test_df
+
+
+# Peak memory of the sorts and window expressions of create_sessions relative to the size of the events
+SORT_MEMORY_FACTOR = 4
+
+
+@beartype
+def num_memory_partitions(events_df: pl.DataFrame, memory_budget: int):
+    """
+    Number of visitor partitions needed to sessionize the events within the memory budget (bytes)
+    """
+
+    return max(1, math.ceil(events_df.estimated_size() * SORT_MEMORY_FACTOR / memory_budget))
+
+
+@beartype
+def visitor_ranges(events_df: pl.DataFrame, num_partitions: int):
+    """
+    Visitor id ranges [low, high) with about the same number of events, in visitor id order
+    The first range has no lower bound and the last range no upper bound.
+    """
+
+    quantiles = events_df.select(
+        pl.col("visitorid").quantile(i / num_partitions, interpolation="lower").alias(str(i))
+        for i in range(1, num_partitions)
+    ).row(0) if num_partitions > 1 else ()
+    edges = sorted({int(edge) for edge in quantiles})
+    return list(zip([None] + edges, edges + [None]))
+
+
+@beartype
+def create_train_test_split_partitioned(events_df: pl.DataFrame, train_weeks: int, test_weeks: int,
+                                        num_partitions: int, spill_path: Path, contiguous_split: bool = False):
+    """
+    Sessionize and split the events one visitor id range at a time, spilling the intermediate results to Parquet
+    Sessions never span visitors, so the peak memory of the sorts and joins is that of one range. The ranges are
+    processed in visitor id order with offset session ids, which gives the same train and test sets as
+    create_sessions and create_train_test_split on all events.
+    """
+
+    split = create_train_test_split_contiguous if contiguous_split else create_train_test_split
+    spill_path.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=spill_path) as spill_dir:
+        spill_dir = Path(spill_dir)
+        session_files = []
+        session_offset = 0
+        for partition, (low, high) in enumerate(visitor_ranges(events_df, num_partitions)):
+            in_range = pl.lit(True)
+            if low is not None:
+                in_range = in_range & (pl.col("visitorid") >= low)
+            if high is not None:
+                in_range = in_range & (pl.col("visitorid") < high)
+            sessions_df = (
+                create_sessions(events_df.filter(in_range))
+                .with_columns((pl.col("session") + session_offset).cast(pl.UInt32))
+            )
+            session_offset = sessions_df.select("session").max().item() or session_offset
+            session_files.append(spill_dir / f"sessions-{partition}.parquet")
+            sessions_df.write_parquet(session_files[-1])
+            del sessions_df
+
+        max_ts = pl.scan_parquet(session_files).select(pl.col("timestamp").max()).collect().item()
+
+        train_files, test_files = [], []
+        for partition, session_file in enumerate(session_files):
+            train_df, test_df = split(pl.read_parquet(session_file), train_weeks, test_weeks, max_ts)
+            train_files.append(spill_dir / f"train-{partition}.parquet")
+            test_files.append(spill_dir / f"test-{partition}.parquet")
+            train_df.write_parquet(train_files[-1])
+            test_df.write_parquet(test_files[-1])
+            del train_df, test_df
+
+        return pl.scan_parquet(train_files).collect(), pl.scan_parquet(test_files).collect()
+
+
+@beartype
+def peak_memory_mb():
+    """
+    Peak resident set size of the process in MB
+    """
+
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    unit = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 1024 / 1024
+
+
+@beartype
+def write_partitioned(sessions_df: pl.DataFrame, output_path: Path, partition_by: str, num_buckets: int = 16,
+                      overwrite: bool = False):
+    """
+    Save sessions as hive partitioned Parquet files, keeping all events of a session in the same partition
+    Sessions are partitioned by the day of their first event (day=YYYY-MM-DD) or by a multiplicative hash of the
+    session id (bucket=N), so partitions can be processed independently.
+    """
+
+    if partition_by == "day":
+        partition_key = pl.from_epoch(pl.col("timestamp").min().over("session")).dt.date().alias("day")
+    elif partition_by == "session-hash":
+        # The bucket comes from the high bits of the 32 bit Fibonacci hash, the low bits would be session % num_buckets
+        partition_key = (
+            (pl.col("session").cast(pl.UInt64) * 2654435761 % 2**32) * num_buckets // 2**32
+        ).cast(pl.UInt32).alias("bucket")
+    else:
+        raise ValueError(f"Unknown partitioning {partition_by}")
+
+    # Partitions of a previous run would otherwise be mixed with the new ones, so the dataset is replaced as a whole
+    if output_path.exists() and not overwrite:
+        raise FileExistsError(f"{output_path} already exists, use overwrite to replace it")
+    tmp_path = temporary_directory(output_path)
+    sessions_df.with_columns(partition_key).write_parquet(tmp_path, partition_by=partition_key.meta.output_name(),
+                                                          mkdir=True)
+    replace_directory(tmp_path, output_path)
+
+
+@beartype
+def read_events(input_path: Path, start_ts: int | None = None, end_ts: int | None = None):
+    """
+    Read the events of an events file, directory of events files or glob pattern with timestamps in seconds
+    """
+
+    return (
+        # The input can be many files, which are read in parallel
+        scan_input_files(expand_input_paths(input_path, 'events*'), EVENTS_SCHEMA, start_ts, end_ts)
         # Convert timestamp to seconds and cast to UInt32 to save memory
         .with_columns((pl.col("timestamp")//1000).cast(pl.UInt32))
+        .collect()
     )
 
-    print("Creating sessions")
-    sessions_df = create_sessions(events_df)
 
-    print("Creating train and test datasets")
-    train_df, test_df = create_train_test_split(sessions_df, train_weeks, test_weeks)
+@beartype
+def write_datasets(train_df: pl.DataFrame, test_df: pl.DataFrame, output_path: Path, compact_schema: bool = False,
+                   partition_by: str | None = None, num_buckets: int = 16, overwrite: bool = False):
+    """
+    Save the train and test sets as CSV files, compact Parquet files or hive partitioned Parquet directories
+    """
+
+    if partition_by is not None:
+        if compact_schema:
+            train_df, test_df = to_compact_schema(train_df), to_compact_schema(test_df)
+        write_partitioned(train_df, output_path / "train_set", partition_by, num_buckets, overwrite)
+        write_partitioned(test_df, output_path / "test_set", partition_by, num_buckets, overwrite)
+    elif compact_schema:
+        to_compact_schema(train_df).write_parquet(output_path / "train_set.parquet")
+        to_compact_schema(test_df).write_parquet(output_path / "test_set.parquet")
+    else:
+        train_set_file = output_path / "train_set.csv"
+        train_df.write_csv(train_set_file)
+        test_set_file = output_path / "test_set.csv"
+        test_df.write_csv(test_set_file)
+
+
+@beartype
+def main(input_path: Path, output_path: Path, train_weeks: int, test_weeks: int, session_store: Path | None = None,
+         contiguous_split: bool = False, compact_schema: bool = False, start_ts: int | None = None,
+         end_ts: int | None = None, partition_by: str | None = None, num_buckets: int = 16,
+         overwrite: bool = False, memory_budget: int | None = None, collapse_repeats: bool = False,
+         max_visitor_events: int | None = None, heavy_visitor_action: str = "drop"):
+    if memory_budget is not None and session_store is not None:
+        raise ValueError("The memory budget is not supported when appending to a session store")
+
+    print("Reading the dataset")
+    events_df = read_events(input_path, start_ts, end_ts)
+
+    if compact_schema:
+        events_df = encode_itemids(events_df, output_path).with_columns(pl.col("event").cast(EVENT_ENUM))
+
+    sketch = None
+    if max_visitor_events is not None:
+        # The batches appended to a session store are a stream, their visitors are counted across batches
+        if session_store is not None:
+            sketch_file = session_store / "visitor_sketch.npy"
+            sketch = CountMinSketch.load(sketch_file) if sketch_file.exists() else CountMinSketch()
+        events_df, removed_events, heavy_visitors = filter_heavy_visitors(events_df, max_visitor_events,
+                                                                          heavy_visitor_action, sketch)
+        print(f"Removed {removed_events} events of {heavy_visitors} visitors with more than {max_visitor_events} "
+              f"events")
+
+    num_partitions = num_memory_partitions(events_df, memory_budget) if memory_budget is not None else 1
+    if session_store is None and num_partitions > 1:
+        print(f"Creating sessions and train and test datasets in {num_partitions} visitor partitions")
+        train_df, test_df = create_train_test_split_partitioned(events_df, train_weeks, test_weeks, num_partitions,
+                                                                output_path, contiguous_split)
+    else:
+        if session_store is not None:
+            print("Appending sessions to the session store")
+            append_to_session_store(events_df, session_store)
+            if sketch is not None:
+                # Saved after the append, a failed append is not counted twice when it is retried
+                sketch.save(sketch_file)
+            sessions_df = read_session_store(session_store)
+        else:
+            print("Creating sessions")
+            sessions_df = create_sessions(events_df)
+
+        print("Creating train and test datasets")
+        if contiguous_split:
+            train_df, test_df = create_train_test_split_contiguous(sessions_df, train_weeks, test_weeks)
+        else:
+            train_df, test_df = create_train_test_split(sessions_df, train_weeks, test_weeks)
+
+    if collapse_repeats:
+        # Collapsed after the split, so that the same sessions are selected as without collapsing
+        print("Collapsing repeated events")
+        train_df = collapse_repeated_events(train_df.sort(["session", "timestamp"], maintain_order=True))
+        test_df = collapse_repeated_events(test_df.sort(["session", "timestamp"], maintain_order=True))
 
     print("Saving the datasets")
-    train_set_file = output_path / "train_set.csv"
-    train_df.write_csv(train_set_file)
-    test_set_file = output_path / "test_set.csv"
-    test_df.write_csv(test_set_file)
+    write_datasets(train_df, test_df, output_path, compact_schema, partition_by, num_buckets, overwrite)
 
+    print(f"Peak memory usage: {peak_memory_mb():.0f} MB")
     print("Done")
 
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--input-path', type=Path, required=True)
+@beartype
+def cli(argv: list[str] | None = None, prog: str | None = None):
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--input-path', type=Path, required=True,
+                        help='Events file, directory of event files or glob pattern of event files')
     parser.add_argument('--output-path', type=Path, required=True)
+    parser.add_argument('--from-date', type=str, default=None, help='Read only events from this date (YYYY-MM-DD)')
+    parser.add_argument('--to-date', type=str, default=None, help='Read only events before this date (YYYY-MM-DD)')
     parser.add_argument('--train-weeks', type=int, default=3)
     parser.add_argument('--test-weeks', type=int, default=2)
-    args = parser.parse_args()
-    main(args.input_path, args.output_path, args.train_weeks, args.test_weeks)
\ No newline at end of file
+    parser.add_argument('--session-store', type=Path, default=None,
+                        help='Append the input events incrementally to this day partitioned session store')
+    parser.add_argument('--contiguous-split', action='store_true',
+                        help='Use the train/test split that relies on the sessions being sorted and contiguous')
+    parser.add_argument('--compact-schema', action='store_true',
+                        help='Use UInt32 item ids and enum events, and save the datasets as Parquet')
+    parser.add_argument('--partition-by', type=str, default=None, choices=['day', 'session-hash'],
+                        help='Save the datasets as hive partitioned Parquet directories')
+    parser.add_argument('--num-buckets', type=int, default=16, help='Number of session hash partitions')
+    parser.add_argument('--overwrite', action='store_true', help='Replace existing partitioned datasets')
+    parser.add_argument('--memory-budget-mb', type=int, default=None,
+                        help='Sessionize and split the events in visitor partitions spilled to disk when the estimated '
+                             'memory usage exceeds this budget')
+    parser.add_argument('--collapse-repeats', action='store_true',
+                        help='Collapse consecutive events of a session with the same item and event type')
+    parser.add_argument('--max-visitor-events', type=int, default=None,
+                        help='Remove the events of visitors with more events than this before sessionization')
+    parser.add_argument('--heavy-visitors', type=str, default="drop", choices=HEAVY_VISITOR_ACTIONS,
+                        help='Drop all events of the heavy visitors or cap them to their first events')
+    args = parser.parse_args(argv)
+    main(args.input_path, args.output_path, args.train_weeks, args.test_weeks, args.session_store,
+         args.contiguous_split, args.compact_schema, date_timestamp(args.from_date), date_timestamp(args.to_date),
+         args.partition_by, args.num_buckets, args.overwrite,
+         args.memory_budget_mb * 1024 * 1024 if args.memory_budget_mb is not None else None, args.collapse_repeats,
+         args.max_visitor_events, args.heavy_visitors)
+
+
+if __name__ == '__main__':
+    cli()
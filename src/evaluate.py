@@ -1,10 +1,29 @@
 import argparse
 import json
 import logging
+import math
+from itertools import repeat
 from pathlib import Path
+from typing import NamedTuple
 
+import numpy as np
 from beartype import beartype
-from tqdm.auto import tqdm
+
+from src.parse_cache import load_cached
+
+# Event types of the labels and predictions
+LABEL_TYPES = ('addtocart', 'transaction')
+
+# Cutoffs k of the metrics when none are given
+DEFAULT_CUTOFFS = (5, 10, 20)
+
+METRICS = {}
+
+
+def tqdm(*args, **kwargs):
+    # Imported on first use, runs reading the labels and predictions from caches do not need it
+    from tqdm.auto import tqdm
+    return tqdm(*args, **kwargs)
 
 
 @beartype
@@ -135,29 +154,588 @@ def get_scores(labels: dict[int, dict], predictions: dict[int, dict], k=20):
     return recalls, mrrs
 
 
+class RankedHits(NamedTuple):
+    """
+    Top predictions of the sessions having labels for an event type
+    sessions: (sessions,) session ids
+    hits: (sessions, max_k) boolean matrix, True if the prediction at the rank is a new hit
+    num_labels: (sessions,) number of labels of each session
+    items: (predicted sessions, max_k) item ids predicted for the event type in every session with predictions,
+        including sessions without labels, -1 where a session has fewer predictions
+    """
+    sessions: np.ndarray
+    hits: np.ndarray
+    num_labels: np.ndarray
+    items: np.ndarray
+
+
+def register_metric(name: str):
+    def decorator(metric):
+        METRICS[name] = metric
+        return metric
+    return decorator
+
+
+@register_metric('recall')
+def recall_at_k(ranked: RankedHits, k: int, catalogue_size: int | None):
+    return ranked.hits[:, :k].sum() / np.minimum(ranked.num_labels, k).sum()
+
+
+@register_metric('precision')
+def precision_at_k(ranked: RankedHits, k: int, catalogue_size: int | None):
+    return (ranked.hits[:, :k].sum(axis=1) / k).mean()
+
+
+@register_metric('hit_rate')
+def hit_rate_at_k(ranked: RankedHits, k: int, catalogue_size: int | None):
+    return ranked.hits[:, :k].any(axis=1).mean()
+
+
+def reciprocal_ranks(ranked: RankedHits, k: int):
+    hits = ranked.hits[:, :k]
+    return np.where(hits.any(axis=1), 1 / (hits.argmax(axis=1) + 1), 0.)
+
+
+# Sessions with labels but without predictions count with a reciprocal rank of 0, unlike mrr_by_event_type
+@register_metric('mrr')
+def mrr_at_k(ranked: RankedHits, k: int, catalogue_size: int | None):
+    return reciprocal_ranks(ranked, k).mean()
+
+
+@register_metric('ndcg')
+def ndcg_at_k(ranked: RankedHits, k: int, catalogue_size: int | None):
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    dcg = ranked.hits[:, :k] @ discounts
+    ideal_dcg = np.cumsum(discounts)[np.minimum(ranked.num_labels, k) - 1]
+    return (dcg / ideal_dcg).mean()
+
+
+@register_metric('coverage')
+def coverage_at_k(ranked: RankedHits, k: int, catalogue_size: int | None):
+    items = ranked.items[:, :k]
+    return len(np.unique(items[items >= 0])) / catalogue_size
+
+
+@beartype
+def rank_hits(labels: dict[int, dict], predictions: dict[int, dict], event_type: str, max_k: int):
+    """
+    Single pass over the sessions with labels for the event type collecting the hits of the top max_k predictions
+    Sessions without predictions have no hits. Repeated predictions of the same item count as a hit only once.
+    The predicted items of all sessions are collected for the coverage.
+    """
+    sessions = [session for session, session_labels in labels.items() if session_labels.get(event_type)]
+    hits = np.zeros((len(sessions), max_k), dtype=bool)
+    num_labels = np.zeros(len(sessions), dtype=np.int64)
+
+    for row, session in enumerate(sessions):
+        session_labels = labels[session][event_type]
+        num_labels[row] = len(session_labels)
+        session_predictions = (predictions.get(session, {}).get(event_type) or [])[:max_k]
+        seen = set()
+        for rank, itemid in enumerate(session_predictions):
+            hits[row, rank] = itemid in session_labels and itemid not in seen
+            seen.add(itemid)
+
+    predicted = [session_predictions[event_type][:max_k] for session_predictions in predictions.values()
+                 if session_predictions.get(event_type)]
+    items = np.full((len(predicted), max_k), -1, dtype=np.int64)
+    for row, session_predictions in enumerate(predicted):
+        items[row, :len(session_predictions)] = session_predictions
+
+    return RankedHits(np.array(sessions, dtype=np.int64), hits, num_labels, items)
+
+
+@beartype
+def default_metrics(metrics: list[str] | None, catalogue_size: int | None):
+    """
+    All registered metrics by default, coverage only with a catalogue size
+    """
+    if metrics is None:
+        return [metric for metric in METRICS if metric != 'coverage' or catalogue_size is not None]
+    if 'coverage' in metrics and catalogue_size is None:
+        raise ValueError("The coverage needs the catalogue size")
+    return metrics
+
+
+@beartype
+def default_cutoffs(cutoffs: list[int] | None):
+    """
+    The default cutoffs for None, otherwise the cutoffs, which must be positive and at least one
+    """
+    if cutoffs is None:
+        return list(DEFAULT_CUTOFFS)
+    if not cutoffs or min(cutoffs) < 1:
+        raise ValueError(f"The cutoffs must be one or more positive integers, not {cutoffs}")
+    return cutoffs
+
+
+@beartype
+def rank_event_types(labels: dict[int, dict], predictions: dict[int, dict], max_k: int):
+    return {event_type: rank_hits(labels, predictions, event_type, max_k) for event_type in LABEL_TYPES}
+
+
+@beartype
+def metrics_from_ranked(ranked_by_type: dict[str, RankedHits], cutoffs: list[int], metrics: list[str],
+                        catalogue_size: int | None):
+    return {
+        event_type: {
+            f"{metric}@{k}": float(METRICS[metric](ranked, k, catalogue_size)) if len(ranked.sessions) else None
+            for metric in metrics for k in cutoffs
+        }
+        for event_type, ranked in ranked_by_type.items()
+    }
+
+
+@beartype
+def compute_metrics(labels: dict[int, dict], predictions: dict[int, dict], cutoffs: list[int] | None = None,
+                    metrics: list[str] | None = None, catalogue_size: int | None = None):
+    '''
+    Calculates the registered metrics at every cutoff from a single pass over the labels and predictions.
+    Args:
+        labels: dict of labels for each session
+        predictions: dict of predictions for each session
+        cutoffs: cutoffs k of the metrics, DEFAULT_CUTOFFS by default
+        metrics: names of the registered metrics to calculate, all by default
+        catalogue_size: number of items in the catalogue, needed for the coverage
+    Returns:
+        dict of metric@k values for each event type, None if there are no labels for the event type
+    '''
+    cutoffs = default_cutoffs(cutoffs)
+    metrics = default_metrics(metrics, catalogue_size)
+    return metrics_from_ranked(rank_event_types(labels, predictions, max(cutoffs)), cutoffs, metrics, catalogue_size)
+
+
+@beartype
+def per_session_scores(ranked: RankedHits, cutoffs: list[int]):
+    """
+    Numerators and denominators of recall@k and MRR@k of every session, the metrics are their sums' ratios
+    """
+    per_session = {}
+    for k in cutoffs:
+        per_session[f"recall@{k}"] = (ranked.hits[:, :k].sum(axis=1), np.minimum(ranked.num_labels, k))
+        per_session[f"mrr@{k}"] = (reciprocal_ranks(ranked, k), np.ones(len(ranked.sessions)))
+    return per_session
+
+
+@beartype
+def bootstrap_intervals(ranked_by_type: dict[str, RankedHits], cutoffs: list[int], num_resamples: int = 1000,
+                        confidence: float = 0.95, seed: int = 42, max_batch_elements: int = 10_000_000):
+    '''
+    Bootstrap confidence intervals of recall and MRR.
+    The per session hits, recall denominators and reciprocal ranks are computed once, and the sessions are resampled
+    in batches of index matrices so that each resample is a vectorized sum over the gathered arrays.
+    Args:
+        ranked_by_type: ranked hits of each event type
+        cutoffs: cutoffs k of the metrics
+        num_resamples: number of bootstrap resamples
+        confidence: confidence level of the intervals
+        seed: seed of the resampling
+        max_batch_elements: maximum size of a batch of resample indices
+    Returns:
+        dict of {"low", "high"} for recall@k and mrr@k of each event type, None if there are no labels
+    '''
+    rng = np.random.default_rng(seed)
+    quantiles = [(1 - confidence) / 2, 1 - (1 - confidence) / 2]
+    intervals = {}
+    for event_type, ranked in ranked_by_type.items():
+        num_sessions = len(ranked.sessions)
+        per_session = per_session_scores(ranked, cutoffs)
+        if num_sessions == 0:
+            intervals[event_type] = {metric: None for metric in per_session}
+            continue
+
+        resampled = {metric: [] for metric in per_session}
+        batch_size = max(1, max_batch_elements // num_sessions)
+        for batch_start in range(0, num_resamples, batch_size):
+            indices = rng.integers(0, num_sessions, size=(min(batch_size, num_resamples - batch_start), num_sessions))
+            for metric, (numerators, denominators) in per_session.items():
+                resampled[metric].append(numerators[indices].sum(axis=1) / denominators[indices].sum(axis=1))
+
+        intervals[event_type] = {}
+        for metric, values in resampled.items():
+            low, high = np.quantile(np.concatenate(values), quantiles)
+            intervals[event_type][metric] = {"low": float(low), "high": float(high)}
+    return intervals
+
+
+# Session length buckets by the lower bound of the number of events before the split
+LENGTH_BUCKETS = [1, 2, 3, 5, 10]
+
+
+@beartype
+def length_bucket_names():
+    return [
+        str(low) if high == low + 1 else f"{low}-{high - 1}"
+        for low, high in zip(LENGTH_BUCKETS, LENGTH_BUCKETS[1:])
+    ] + [f"{LENGTH_BUCKETS[-1]}+"]
+
+
+@beartype
+def partition_files(path: Path, file_name: str, partitions: list[str] | None = None):
+    """
+    Files named file_name of the selected partitions (e.g. bucket=3) of a partitioned test set output directory
+    """
+    partition_paths = sorted(path.iterdir())
+    if partitions is not None:
+        unknown = set(partitions) - {partition_path.name for partition_path in partition_paths}
+        if unknown:
+            raise ValueError(f"Unknown partitions {sorted(unknown)} of {path}")
+        partition_paths = [partition_path for partition_path in partition_paths if partition_path.name in partitions]
+    return [partition_path / file_name for partition_path in partition_paths
+            if (partition_path / file_name).exists()]
+
+
+@beartype
+def length_segments(sessions: list[int], session_lengths: dict[int, int]):
+    """
+    Session length bucket names of the sessions
+    """
+    lengths = np.array([session_lengths.get(session, 0) for session in sessions])
+    # Sessions without a known length get bucket -1, the last name "unknown"
+    buckets = np.searchsorted(LENGTH_BUCKETS, lengths, side="right") - 1
+    return np.array(length_bucket_names() + ["unknown"])[buckets]
+
+
 @beartype
-def main(labels_path: Path, predictions_path: Path):
+def read_session_lengths(test_sessions_path: Path, partitions: list[str] | None = None):
+    if test_sessions_path.is_dir():
+        session_lengths = {}
+        for partition_sessions_path in partition_files(test_sessions_path, "test_sessions.jsonl", partitions):
+            session_lengths.update(read_session_lengths(partition_sessions_path))
+        return session_lengths
+    session_lengths = {}
+    with open(test_sessions_path, "r") as f:
+        for line in tqdm(f, desc="Reading session lengths"):
+            session = json.loads(line)
+            session_lengths[session["session"]] = len(session["events"])
+    return session_lengths
+
+
+@beartype
+def label_type(session_labels: dict):
+    has_carts = bool(session_labels.get("addtocart"))
+    has_orders = bool(session_labels.get("transaction"))
+    return "both" if has_carts and has_orders else "addtocart" if has_carts else "transaction"
+
+
+@beartype
+def segment_breakdown(ranked_by_type: dict[str, RankedHits], cutoffs: list[int], labels: dict[int, dict],
+                      session_lengths: dict[int, int] | None = None):
+    '''
+    Recall and MRR by label type of the session and, when session lengths are given, by session length bucket.
+    Computed from the ranked hits without evaluating the sessions again.
+    Returns:
+        dict of segment kind, segment and {"sessions", recall@k, mrr@k} for each event type
+    '''
+    breakdown = {}
+    for event_type, ranked in ranked_by_type.items():
+        segments = {"label_type": np.array([label_type(labels[session]) for session in ranked.sessions.tolist()])}
+        if session_lengths is not None:
+            segments["session_length"] = length_segments(ranked.sessions.tolist(), session_lengths)
+
+        breakdown[event_type] = {}
+        for kind, segment_of_session in segments.items():
+            breakdown[event_type][kind] = {}
+            for segment in np.unique(segment_of_session).tolist():
+                mask = segment_of_session == segment
+                scores = {"sessions": int(mask.sum())}
+                for k in cutoffs:
+                    scores[f"recall@{k}"] = float(
+                        ranked.hits[mask, :k].sum() / np.minimum(ranked.num_labels[mask], k).sum())
+                    scores[f"mrr@{k}"] = float(reciprocal_ranks(ranked, k)[mask].mean())
+                breakdown[event_type][kind][segment] = scores
+    return breakdown
+
+
+class SessionSample(NamedTuple):
+    """
+    Stratified sample of the sessions with labels
+    strata: stratum (label type and session length bucket) of every sampled session
+    population: number of sessions with labels in every stratum
+    """
+    strata: dict[int, str]
+    population: dict[str, int]
+
+
+@beartype
+def sample_sessions(labels: dict[int, dict], sample_rate: float, session_lengths: dict[int, int] | None = None,
+                    seed: int = 0):
+    '''
+    Deterministic stratified sample of the sessions with labels.
+    The sessions are stratified by label type and, when session lengths are given, by session length bucket. In every
+    stratum the sessions with the smallest hash of the session id are sampled, so the same sessions are chosen for
+    every model and sample rates give nested samples. At least 2 sessions of a stratum are sampled for its variance.
+    '''
+    sessions = [session for session, session_labels in labels.items() if any(session_labels.values())]
+    strata = np.array([label_type(labels[session]) for session in sessions], dtype=object)
+    if session_lengths is not None:
+        strata = strata + "/" + length_segments(sessions, session_lengths).astype(object)
+    sessions = np.array(sessions, dtype=np.int64)
+    # 32 bit Fibonacci hash of the session id
+    hashes = ((sessions.astype(np.uint64) + np.uint64(seed)) * np.uint64(2654435761)) % np.uint64(2**32)
+
+    sampled, population = {}, {}
+    for stratum in np.unique(strata).tolist():
+        members = np.flatnonzero(strata == stratum)
+        population[stratum] = len(members)
+        num_sampled = min(len(members), max(2, math.ceil(sample_rate * len(members))))
+        chosen = members[np.argsort(hashes[members], kind="stable")[:num_sampled]]
+        sampled.update(zip(sessions[chosen].tolist(), repeat(stratum)))
+    return SessionSample(sampled, population)
+
+
+@beartype
+def stratified_ratio(numerators: np.ndarray, denominators: np.ndarray, strata: np.ndarray, population: dict[str, int]):
+    '''
+    Stratified ratio estimate of sum(numerators) / sum(denominators) over the population and its standard error.
+    The stratum totals are estimated from the stratum means and the variance is the linearized variance of the ratio
+    with the finite population correction.
+    '''
+    masks = {stratum: strata == stratum for stratum in np.unique(strata).tolist()}
+    total_numerator = sum(population[stratum] * numerators[mask].mean() for stratum, mask in masks.items())
+    total_denominator = sum(population[stratum] * denominators[mask].mean() for stratum, mask in masks.items())
+    ratio = total_numerator / total_denominator
+    residuals = numerators - ratio * denominators
+
+    variance = 0.
+    for stratum, mask in masks.items():
+        num_sampled, size = mask.sum(), population[stratum]
+        if num_sampled > 1:
+            variance += size ** 2 * (1 - num_sampled / size) * residuals[mask].var(ddof=1) / num_sampled
+    return {"estimate": float(ratio), "standard_error": float(np.sqrt(variance) / total_denominator)}
+
+
+@beartype
+def sampled_estimates(ranked_by_type: dict[str, RankedHits], cutoffs: list[int], sample: SessionSample):
+    '''
+    Estimates of recall and MRR over all sessions with labels from the ranked hits of a stratified sample.
+    Returns:
+        dict of {"estimate", "standard_error"} for recall@k and mrr@k of each event type, None if there are no labels
+    '''
+    estimates = {}
+    for event_type, ranked in ranked_by_type.items():
+        per_session = per_session_scores(ranked, cutoffs)
+        if len(ranked.sessions) == 0:
+            estimates[event_type] = {metric: None for metric in per_session}
+            continue
+        strata = np.array([sample.strata[session] for session in ranked.sessions.tolist()], dtype=object)
+        estimates[event_type] = {
+            metric: stratified_ratio(numerators, denominators, strata, sample.population)
+            for metric, (numerators, denominators) in per_session.items()
+        }
+    return estimates
+
+
+@beartype
+def evaluate_report(labels: dict[int, dict], predictions: dict[int, dict], cutoffs: list[int] | None = None,
+                    metrics: list[str] | None = None, catalogue_size: int | None = None,
+                    bootstrap_resamples: int = 0, breakdown: bool = False,
+                    session_lengths: dict[int, int] | None = None, sample: SessionSample | None = None):
+    '''
+    Metrics, and optionally bootstrap confidence intervals and segment breakdowns, from a single ranking pass.
+    With a sample, the labels are those of the sampled sessions and the metrics are those of the sample.
+    Returns:
+        dict with "metrics" and, when requested, "confidence_intervals", "segments" and "sampled_estimates"
+    '''
+    cutoffs = default_cutoffs(cutoffs)
+    metrics = default_metrics(metrics, catalogue_size)
+    ranked_by_type = rank_event_types(labels, predictions, max(cutoffs))
+
+    report = {"metrics": metrics_from_ranked(ranked_by_type, cutoffs, metrics, catalogue_size)}
+    if bootstrap_resamples > 0:
+        report["confidence_intervals"] = bootstrap_intervals(ranked_by_type, cutoffs, bootstrap_resamples)
+    if breakdown:
+        report["segments"] = segment_breakdown(ranked_by_type, cutoffs, labels, session_lengths)
+    if sample is not None:
+        report["sampled_estimates"] = sampled_estimates(ranked_by_type, cutoffs, sample)
+    return report
+
+
+@beartype
+def read_labels(labels_path: Path, cache: bool = False, partitions: list[str] | None = None):
+    if labels_path.is_dir():
+        # Labels of a partitioned test set, one test_labels.jsonl per partition
+        labels = {}
+        for partition_labels_path in partition_files(labels_path, "test_labels.jsonl", partitions):
+            labels.update(read_labels(partition_labels_path, cache))
+        return labels
+    if cache:
+        return load_cached(labels_path, read_labels, LABEL_TYPES, container=set)
     with open(labels_path, "r") as f:
         logging.info(f"Reading labels from {labels_path}")
         labels = f.readlines()
         labels = prepare_labels(labels)
         logging.info(f"Read {len(labels)} labels")
+    return labels
+
+
+@beartype
+def read_predictions(predictions_path: Path, cache: bool = False, sessions: set[int] | None = None):
+    """
+    Read the predictions, only of the given sessions if sessions is not None
+    """
+    if cache:
+        predictions = load_cached(predictions_path, read_predictions, LABEL_TYPES)
+        if sessions is not None:
+            predictions = {session: predictions[session] for session in sessions if session in predictions}
+        return predictions
     with open(predictions_path, "r") as f:
         logging.info(f"Reading predictions from {predictions_path}")
         predictions = f.readlines()[1:]
+        if sessions is not None:
+            # Only the lines of the sessions are split and parsed
+            predictions = [line for line in predictions if int(line[:line.find("_")]) in sessions]
         predictions = prepare_predictions(predictions)
         logging.info(f"Read {len(predictions)} predictions")
+    return predictions
+
+
+@beartype
+def find_predictions_files(paths: list[Path]):
+    """
+    Predictions files given directly or as directories of csv files
+    """
+    files = []
+    for path in paths:
+        files.extend(sorted(path.glob("*.csv")) if path.is_dir() else [path])
+    return files
+
+
+# Labels shared by the worker processes, set once per worker by the pool initializer
+_worker_labels = None
+
+
+def _init_worker(labels: dict):
+    global _worker_labels
+    _worker_labels = labels
+
+
+def _evaluate_predictions_file(predictions_path: Path, cache_predictions: bool, cutoffs: list[int],
+                               metrics: list[str] | None, catalogue_size: int | None, bootstrap_resamples: int,
+                               breakdown: bool, session_lengths: dict[int, int] | None, sample: SessionSample | None):
+    predictions = read_predictions(predictions_path, cache_predictions,
+                                   set(_worker_labels) if sample is not None else None)
+    return evaluate_report(_worker_labels, predictions, cutoffs, metrics, catalogue_size, bootstrap_resamples,
+                           breakdown, session_lengths, sample)
+
+
+@beartype
+def evaluate_models(labels: dict[int, dict], predictions_paths: list[Path], cutoffs: list[int] | None = None,
+                    metrics: list[str] | None = None, catalogue_size: int | None = None, workers: int = 1,
+                    bootstrap_resamples: int = 0, breakdown: bool = False,
+                    session_lengths: dict[int, int] | None = None, cache_predictions: bool = False,
+                    sample: SessionSample | None = None):
+    '''
+    Calculates the metrics for many predictions files against labels parsed once.
+    Args:
+        labels: dict of labels for each session
+        predictions_paths: predictions files of the models
+        cutoffs, metrics, catalogue_size, bootstrap_resamples, breakdown, session_lengths, sample: see evaluate_report
+        workers: number of worker processes evaluating the predictions files in parallel
+        cache_predictions: read the predictions files through their binary caches
+    Returns:
+        dict of reports for each predictions file, keyed by the file name without suffix
+    '''
+    cutoffs = default_cutoffs(cutoffs)
+    options = (cache_predictions, cutoffs, metrics, catalogue_size, bootstrap_resamples, breakdown, session_lengths,
+               sample)
+    names = [path.stem for path in predictions_paths]
+    if len(set(names)) != len(names):
+        names = [str(path) for path in predictions_paths]
+
+    if workers == 1 or len(predictions_paths) == 1:
+        _init_worker(labels)
+        reports = [_evaluate_predictions_file(path, *options) for path in predictions_paths]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(labels,)) as executor:
+            reports = list(executor.map(_evaluate_predictions_file, predictions_paths,
+                                        *[repeat(option) for option in options]))
+    return dict(zip(names, reports))
+
+
+@beartype
+def comparison_table(model_reports: dict[str, dict]):
+    """
+    Text table with a row for each model and a column for each event type and metric
+    """
+    model_scores = {name: report["metrics"] for name, report in model_reports.items()}
+    columns = [(event_type, metric) for event_type, event_scores in next(iter(model_scores.values())).items()
+               for metric in event_scores]
+    header = ["model"] + [f"{event_type} {metric}" for event_type, metric in columns]
+    rows = [
+        [name] + ["-" if scores[event_type][metric] is None else f"{scores[event_type][metric]:.4f}"
+                  for event_type, metric in columns]
+        for name, scores in model_scores.items()
+    ]
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in [header] + rows)
+
+
+@beartype
+def main(labels_path: Path, predictions_paths: list[Path], cutoffs: list[int] | None = None,
+         metrics: list[str] | None = None, catalogue_size: int | None = None, output_path: Path | None = None,
+         workers: int = 1, bootstrap_resamples: int = 0, breakdown: bool = False,
+         test_sessions_path: Path | None = None, cache: bool = False, cache_predictions: bool = False,
+         partitions: list[str] | None = None, sample_rate: float | None = None):
+    cutoffs = default_cutoffs(cutoffs)
+    labels = read_labels(labels_path, cache, partitions)
+    session_lengths = (
+        read_session_lengths(test_sessions_path, partitions) if test_sessions_path is not None else None
+    )
+    sample = None
+    if sample_rate is not None:
+        sample = sample_sessions(labels, sample_rate, session_lengths)
+        labels = {session: labels[session] for session in sample.strata}
+        logging.info(f"Sampled {len(labels)} sessions")
+    predictions_paths = find_predictions_files(predictions_paths)
     logging.info("Calculating scores")
-    k = 20
-    recalls, mrrs = get_scores(labels, predictions, k)
-    logging.info(f"Recall@{k} scores: {recalls}")
-    logging.info(f"MRR@{k} scores: {recalls}")
+    model_reports = evaluate_models(labels, predictions_paths, cutoffs, metrics, catalogue_size, workers,
+                                    bootstrap_resamples, breakdown, session_lengths, cache_predictions, sample)
 
+    if len(model_reports) == 1:
+        print(json.dumps(next(iter(model_reports.values())), indent=2))
+    else:
+        print(comparison_table(model_reports))
+    if output_path is not None:
+        with open(output_path, "w") as f:
+            json.dump(model_reports if len(model_reports) > 1 else next(iter(model_reports.values())), f, indent=2)
 
-if __name__ == "__main__":
+
+@beartype
+def cli(argv: list[str] | None = None, prog: str | None = None):
     logging.basicConfig(level=logging.INFO)
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(prog=prog)
     parser.add_argument('--test-labels', default="resources/test_labels.jsonl", type=str)
-    parser.add_argument('--predictions', default="resources/predictions.csv", type=str)
-    args = parser.parse_args()
-    main(Path(args.test_labels), Path(args.predictions))
+    parser.add_argument('--predictions', default=["resources/predictions.csv"], type=str, nargs='+',
+                        help='Predictions files or directories of predictions files to compare')
+    parser.add_argument('--cutoffs', default=list(DEFAULT_CUTOFFS), type=int, nargs='+')
+    parser.add_argument('--metrics', default=None, nargs='+', choices=sorted(METRICS))
+    parser.add_argument('--catalogue-size', default=None, type=int,
+                        help='Number of items in the catalogue, the coverage is only calculated with it')
+    parser.add_argument('--output', default=None, type=str, help='Save the metrics as JSON to this file')
+    parser.add_argument('--workers', default=1, type=int, help='Number of processes evaluating predictions files')
+    parser.add_argument('--bootstrap', default=0, type=int,
+                        help='Number of bootstrap resamples for confidence intervals of recall and MRR')
+    parser.add_argument('--breakdown', action='store_true', help='Recall and MRR by label type and session length')
+    parser.add_argument('--test-sessions', default=None, type=str,
+                        help='test_sessions.jsonl for the session length breakdown')
+    parser.add_argument('--cache', action='store_true',
+                        help='Read the labels from a binary cache next to the labels file, created on the first run')
+    parser.add_argument('--cache-predictions', action='store_true',
+                        help='Read the predictions from binary caches next to the predictions files')
+    parser.add_argument('--partitions', default=None, type=str, nargs='+',
+                        help='Evaluate only these partitions (e.g. bucket=3) of partitioned test labels')
+    parser.add_argument('--sample-rate', default=None, type=float,
+                        help='Evaluate a stratified sample of this fraction of the sessions and estimate recall and '
+                             'MRR with their standard errors')
+    args = parser.parse_args(argv)
+    main(Path(args.test_labels), [Path(path) for path in args.predictions], args.cutoffs, args.metrics,
+         args.catalogue_size, Path(args.output) if args.output else None, args.workers, args.bootstrap,
+         args.breakdown, Path(args.test_sessions) if args.test_sessions else None, args.cache,
+         args.cache_predictions, args.partitions, args.sample_rate)
+
+
+if __name__ == "__main__":
+    cli()
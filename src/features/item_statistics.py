@@ -0,0 +1,139 @@
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+from beartype import beartype
+
+from src.data_generation.product_category_tree import get_max_ts
+from src.data_generation.schema import (COLLAPSED_COLUMNS, event_count, last_event_timestamp, read_sessions,
+                                        session_columns, sessions_file)
+
+# One record per item id, items without train events have last_seen 0
+ITEM_STATISTICS_DTYPE = np.dtype([
+    ("views", np.uint32),
+    ("addtocarts", np.uint32),
+    ("transactions", np.uint32),
+    ("popularity", np.float32),
+    ("last_seen", np.uint32),
+])
+
+
+@beartype
+def item_statistics(sessions_df: pl.DataFrame, max_ts: int, half_life_days: float = 7.):
+    """
+    Event counts, time decayed popularity and last seen timestamp of every item in a single grouped aggregation
+    Every event contributes 2^(-age / half life) to the popularity, where the age is relative to max_ts. The rows of
+    collapse_repeated_events count repeats events, and as their timestamps between the first and the last repeat are
+    not known, each repeat contributes the mean of the contributions of the first and the last repeat.
+    """
+
+    half_life = half_life_days * 24 * 60 * 60
+    count = event_count(sessions_df.columns)
+    last_timestamp = last_event_timestamp(sessions_df.columns)
+
+    def decay(timestamp: pl.Expr):
+        return 2 ** (-(max_ts - timestamp.cast(pl.Float64)) / half_life)
+
+    return (
+        sessions_df
+        .group_by(pl.col("itemid").cast(pl.UInt32))
+        .agg(
+            views=pl.when(pl.col("event") == "view").then(count).otherwise(0).sum().cast(pl.UInt32),
+            addtocarts=pl.when(pl.col("event") == "addtocart").then(count).otherwise(0).sum().cast(pl.UInt32),
+            transactions=pl.when(pl.col("event") == "transaction").then(count).otherwise(0).sum().cast(pl.UInt32),
+            popularity=(count * (decay(pl.col("timestamp")) + decay(last_timestamp)) / 2).sum().cast(pl.Float32),
+            last_seen=last_timestamp.max().cast(pl.UInt32),
+        )
+        .sort("itemid")
+    )
+
+
+@beartype
+def to_dense_array(statistics_df: pl.DataFrame):
+    """
+    Item statistics as a structured array indexed by item id
+    """
+
+    itemids = statistics_df.get_column("itemid").to_numpy()
+    statistics = np.zeros(int(itemids.max()) + 1 if len(itemids) else 0, dtype=ITEM_STATISTICS_DTYPE)
+    for field in ITEM_STATISTICS_DTYPE.names:
+        statistics[field][itemids] = statistics_df.get_column(field).to_numpy()
+    return statistics
+
+
+@beartype
+def write_item_statistics(statistics: np.ndarray, path: Path):
+    temporary_path = path.with_suffix(".tmp")
+    with open(temporary_path, "wb") as f:
+        np.save(f, statistics)
+    os.replace(temporary_path, path)
+
+
+class ItemStatistics:
+    """
+    Memory-mapped item statistics with constant time lookups by item id and global top-N lists for cold-start sessions
+    """
+
+    def __init__(self, path: Path):
+        self.statistics = np.load(path, mmap_mode="r")
+        self._rankings = {}
+
+    def __len__(self):
+        return len(self.statistics)
+
+    def __contains__(self, itemid: int):
+        return 0 <= itemid < len(self.statistics) and self.statistics["last_seen"][itemid] > 0
+
+    def __getitem__(self, itemid: int):
+        """
+        Statistics of the item as a dict, zero counts for unknown items
+        """
+        if itemid not in self:
+            return {field: 0 for field in ITEM_STATISTICS_DTYPE.names}
+        record = self.statistics[itemid]
+        return {field: record[field].item() for field in ITEM_STATISTICS_DTYPE.names}
+
+    def top_items(self, n: int, by: str = "popularity"):
+        """
+        Item ids of the n items with the highest statistic, ties broken by the smaller item id
+        The ranking of a statistic is computed once and reused.
+        """
+        if by not in self._rankings:
+            values = np.asarray(self.statistics[by])
+            ranking = np.lexsort((np.arange(len(values)), -values.astype(np.float64)))
+            self._rankings[by] = ranking[values[ranking] > 0]
+        return self._rankings[by][:n].tolist()
+
+
+@beartype
+def main(train_set_path: Path, output_path: Path, half_life_days: float = 7.):
+    print("Reading the dataset")
+    max_ts = get_max_ts(train_set_path)
+    train_set_file = sessions_file(train_set_path, 'train_set')
+    collapsed_columns = [column for column in COLLAPSED_COLUMNS if column in session_columns(train_set_file)]
+    sessions_df = read_sessions(train_set_file, columns=["timestamp", "event", "itemid"] + collapsed_columns)
+
+    print("Computing item statistics")
+    statistics = to_dense_array(item_statistics(sessions_df, max_ts, half_life_days))
+
+    print("Saving the item statistics")
+    write_item_statistics(statistics, output_path / "item_statistics.npy")
+
+    print("Done")
+
+
+@beartype
+def cli(argv: list[str] | None = None, prog: str | None = None):
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--train-set-path', type=Path, required=True)
+    parser.add_argument('--output-path', type=Path, required=True)
+    parser.add_argument('--half-life-days', type=float, default=7.,
+                        help='Half-life of the popularity decay relative to the last train timestamp')
+    args = parser.parse_args(argv)
+    main(args.train_set_path, args.output_path, args.half_life_days)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,65 @@
+import argparse
+from pathlib import Path
+
+import polars as pl
+from beartype import beartype
+
+from src.data_generation.schema import (COLLAPSED_COLUMNS, event_count, last_event_timestamp, read_sessions,
+                                        read_test_sessions, session_columns, sessions_file)
+
+
+@beartype
+def session_features(sessions_df: pl.DataFrame):
+    """
+    Features of every session in a single grouped pass over its events
+    length: number of events, distinct_items: number of different items, addtocarts: number of addtocart events,
+    duration: seconds between the first and the last event, last_event: type of the last event,
+    last_event_gap: seconds between the last two events, null for sessions with a single event
+    The rows of collapse_repeated_events count repeats events, and last_event_gap is the gap before the last run of
+    repeats.
+    """
+
+    count = event_count(sessions_df.columns)
+    last_timestamp = last_event_timestamp(sessions_df.columns).cast(pl.Int64)
+    return (
+        sessions_df
+        .sort(["session", "timestamp"], maintain_order=True)
+        .group_by("session", maintain_order=True)
+        .agg(
+            length=count.sum().cast(pl.UInt32),
+            distinct_items=pl.col("itemid").n_unique().cast(pl.UInt32),
+            addtocarts=pl.when(pl.col("event") == "addtocart").then(count).otherwise(0).sum().cast(pl.UInt32),
+            duration=(last_timestamp.max() - pl.col("timestamp").min()).cast(pl.UInt32),
+            last_event=pl.col("event").last().cast(pl.String),
+            last_event_gap=(pl.col("timestamp").cast(pl.Int64) - last_timestamp.shift()).last().cast(pl.UInt32),
+        )
+    )
+
+
+@beartype
+def main(train_set_path: Path, test_sessions_path: Path, output_path: Path):
+    print("Computing train session features")
+    train_set_file = sessions_file(train_set_path, 'train_set')
+    collapsed_columns = [column for column in COLLAPSED_COLUMNS if column in session_columns(train_set_file)]
+    train_df = read_sessions(train_set_file, columns=["timestamp", "event", "itemid", "session"] + collapsed_columns)
+    session_features(train_df).write_parquet(output_path / "train_session_features.parquet")
+
+    print("Computing test session features")
+    session_features(read_test_sessions(test_sessions_path)).write_parquet(
+        output_path / "test_session_features.parquet")
+
+    print("Done")
+
+
+@beartype
+def cli(argv: list[str] | None = None, prog: str | None = None):
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--train-set-path', type=Path, required=True)
+    parser.add_argument('--test-sessions', type=Path, required=True, help='test_sessions.jsonl of testset_labels')
+    parser.add_argument('--output-path', type=Path, required=True)
+    args = parser.parse_args(argv)
+    main(args.train_set_path, args.test_sessions, args.output_path)
+
+
+if __name__ == '__main__':
+    cli()
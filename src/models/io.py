@@ -0,0 +1,16 @@
+from pathlib import Path
+
+from beartype import beartype
+
+
+@beartype
+def write_predictions(predictions: dict[int, dict[str, list[int]]], path: Path):
+    """
+    Save the predictions of the sessions in the predictions.csv format read by evaluate, one line per session and
+    event type: <session>_<event type>,<space separated item ids>
+    """
+    with open(path, "w") as f:
+        f.write("session_type,labels\n")
+        for session, session_predictions in predictions.items():
+            for event_type, items in session_predictions.items():
+                f.write(f"{session}_{event_type},{' '.join(map(str, items))}\n")
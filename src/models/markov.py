@@ -0,0 +1,195 @@
+import argparse
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import polars as pl
+from beartype import beartype
+from tqdm.auto import tqdm
+
+from src.data_generation.schema import read_sessions, read_test_sessions, sessions_file
+from src.data_generation.testset_labels import iter_session_chunks
+from src.evaluate import LABEL_TYPES
+from src.models.io import write_predictions
+from src.models.recommendation_cache import RecommendationCache
+from src.models.sparse import csr_indptr, csr_offsets
+
+# Weight of the transitions from an event of the session by the type of the event
+EVENT_WEIGHTS = {"view": 1., "addtocart": 2., "transaction": 2.}
+
+
+class TransitionMatrix(NamedTuple):
+    """
+    Item to next item transition probabilities in CSR form
+    indptr: (items + 1,) offsets of the rows of the items
+    indices: next item ids of the rows, by decreasing probability
+    data: transition probabilities of the rows
+    popular: most frequent next items, recommended when a session has fewer scored items
+    """
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+    popular: np.ndarray
+
+
+@beartype
+def build_transition_matrix(sessions_df: pl.DataFrame, max_next_items: int = 100, num_popular: int = 100):
+    """
+    Count the transitions between consecutive events of the sessions in one vectorized pass
+    Only the max_next_items most frequent next items of an item are kept, the probabilities are relative to all
+    transitions from the item.
+    """
+    transitions = (
+        sessions_df
+        .sort(["session", "timestamp"], maintain_order=True)
+        .select(
+            item=pl.col("itemid").cast(pl.Int64),
+            next_item=pl.col("itemid").cast(pl.Int64).shift(-1),
+            same_session=pl.col("session") == pl.col("session").shift(-1),
+        )
+        .filter(pl.col("same_session"))
+        .group_by("item", "next_item")
+        .agg(count=pl.len())
+    )
+    popular = (
+        transitions
+        .group_by("next_item")
+        .agg(pl.col("count").sum())
+        .sort(["count", "next_item"], descending=[True, False])
+        .head(num_popular)
+        .get_column("next_item")
+        .to_numpy()
+    )
+    transitions = (
+        transitions
+        .with_columns(probability=(pl.col("count") / pl.col("count").sum().over("item")).cast(pl.Float32))
+        .sort(["item", "count", "next_item"], descending=[False, True, False])
+        .filter(pl.int_range(pl.len()).over("item") < max_next_items)
+    )
+
+    num_items = int(sessions_df.select(pl.col("itemid").cast(pl.Int64).max()).item() or 0) + 1
+    indptr = csr_indptr(transitions.get_column("item").to_numpy(), num_items)
+    return TransitionMatrix(indptr, transitions.get_column("next_item").to_numpy(),
+                            transitions.get_column("probability").to_numpy(), popular)
+
+
+@beartype
+def save_transition_matrix(matrix: TransitionMatrix, path: Path):
+    np.savez(path, **matrix._asdict())
+
+
+@beartype
+def load_transition_matrix(path: Path):
+    with np.load(path) as arrays:
+        return TransitionMatrix(**{field: arrays[field] for field in TransitionMatrix._fields})
+
+
+@beartype
+def gather_rows(matrix: TransitionMatrix, rows: np.ndarray):
+    """
+    Concatenated next items and probabilities of the rows, and the index in rows of each gathered value
+    """
+    positions, owners = csr_offsets(matrix.indptr, rows)
+    return matrix.indices[positions], matrix.data[positions], owners
+
+
+@beartype
+def score_sessions(matrix: TransitionMatrix, events_df: pl.DataFrame, k: int = 20, recency_decay: float = 0.8,
+                   max_events: int = 10):
+    """
+    Top k next items of a batch of sessions
+    The rows of the last max_events items of every session are gathered at once, weighted by the event type and by
+    recency_decay ** (number of later events), and summed per session and next item.
+    """
+    events = (
+        events_df
+        .sort(["session", "timestamp"], maintain_order=True)
+        .with_columns(age=pl.int_range(pl.len()).reverse().over("session"))
+        .filter(pl.col("age") < max_events)
+    )
+    sessions, session_index = np.unique(events.get_column("session").to_numpy(), return_inverse=True)
+    items = events.get_column("itemid").cast(pl.Int64).to_numpy()
+    weights = (
+        events.get_column("event").cast(pl.String).replace_strict(EVENT_WEIGHTS, default=1.).to_numpy()
+        * recency_decay ** events.get_column("age").to_numpy()
+    )
+    # Items not in the train set have no transitions
+    known = items < len(matrix.indptr) - 1
+    items, weights, session_index = items[known], weights[known], session_index[known]
+
+    next_items, probabilities, owners = gather_rows(matrix, items)
+    num_items = max(len(matrix.indptr) - 1, 1)
+    keys, inverse = np.unique(session_index[owners] * num_items + next_items, return_inverse=True)
+    scores = np.bincount(inverse, weights=probabilities * weights[owners])
+    key_sessions, key_items = keys // num_items, keys % num_items
+
+    order = np.lexsort((key_items, -scores, key_sessions))
+    key_sessions, key_items = key_sessions[order], key_items[order]
+    ranks = np.arange(len(order)) - np.searchsorted(key_sessions, key_sessions)
+    top = ranks < k
+    bounds = np.searchsorted(key_sessions[top], np.arange(len(sessions) + 1))
+    top_items = key_items[top].tolist()
+
+    recommendations = {}
+    for index, session in enumerate(sessions.tolist()):
+        session_items = top_items[bounds[index]:bounds[index + 1]]
+        if len(session_items) < k:
+            session_items += [item for item in matrix.popular.tolist() if item not in session_items][
+                             :k - len(session_items)]
+        recommendations[session] = session_items
+    return recommendations
+
+
+@beartype
+def main(train_set_path: Path, test_sessions_path: Path, output_path: Path, k: int = 20, max_next_items: int = 100,
+         recency_decay: float = 0.8, batch_size: int = 10000, model_path: Path | None = None,
+         cache_path: Path | None = None):
+    cache = None
+    if cache_path is not None:
+        cache = RecommendationCache(cache_path)
+        cache.check("markov", {"max_next_items": max_next_items}, k)
+
+    print("Building the transition matrix")
+    train_df = read_sessions(sessions_file(train_set_path, 'train_set'), columns=["timestamp", "event", "itemid",
+                                                                                   "session"])
+    matrix = build_transition_matrix(train_df, max_next_items)
+    if model_path is not None:
+        save_transition_matrix(matrix, model_path)
+
+    print("Scoring the test sessions")
+    test_df = read_test_sessions(test_sessions_path).sort(["session", "timestamp"], maintain_order=True)
+    predictions = {}
+    for chunk_df in tqdm(iter_session_chunks(test_df, batch_size), desc="Scoring sessions"):
+        if cache is not None:
+            cached, chunk_df = cache.lookup_sessions(chunk_df, k)
+            predictions.update(cached)
+        for session, items in score_sessions(matrix, chunk_df, k, recency_decay).items():
+            predictions[session] = {event_type: items for event_type in LABEL_TYPES}
+    if cache is not None:
+        print(f"Cache {cache.counters()}")
+    write_predictions(predictions, output_path)
+
+    print("Done")
+
+
+@beartype
+def cli(argv: list[str] | None = None, prog: str | None = None):
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--train-set-path', type=Path, required=True)
+    parser.add_argument('--test-sessions', type=Path, required=True, help='test_sessions.jsonl of testset_labels')
+    parser.add_argument('--output-path', type=Path, required=True, help='Predictions file to write')
+    parser.add_argument('--k', type=int, default=20, help='Number of recommended items')
+    parser.add_argument('--max-next-items', type=int, default=100, help='Next items kept for every item')
+    parser.add_argument('--recency-decay', type=float, default=0.8,
+                        help='Weight decay of the transitions of an event for every later event of the session')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Number of sessions scored at a time')
+    parser.add_argument('--model-path', type=Path, default=None, help='Save the transition matrix to this .npz file')
+    parser.add_argument('--cache-path', type=Path, default=None,
+                        help='Recommendation cache of src.models.recommendation_cache for single event sessions')
+    args = parser.parse_args(argv)
+    main(args.train_set_path, args.test_sessions, args.output_path, args.k, args.max_next_items, args.recency_decay,
+         args.batch_size, args.model_path, args.cache_path)
+
+
+if __name__ == '__main__':
+    cli()
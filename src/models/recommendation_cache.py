@@ -0,0 +1,230 @@
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+from beartype import beartype
+
+from src.data_generation.schema import EVENT_TYPES, read_sessions, sessions_file
+from src.data_generation.testset_labels import iter_session_chunks
+from src.evaluate import LABEL_TYPES
+from src.output_files import replace_directory, temporary_directory
+
+# Options of the models changing their recommendations, the cache is only used with the options it was built with
+MODEL_OPTIONS = {
+    "markov": {"max_next_items": 100},
+    "knn": {"max_sessions_per_item": 1000, "sample_size": 500, "neighbours": 100},
+}
+
+
+@beartype
+def cache_keys(sessions_df: pl.DataFrame):
+    """
+    Distinct (itemid, event) pairs of the train events, the keys of the cache
+    """
+    return (
+        sessions_df
+        .select(pl.col("itemid").cast(pl.Int64), pl.col("event").cast(pl.String))
+        .unique()
+        .sort("itemid", "event")
+    )
+
+
+@beartype
+def build_cache_table(keys_df: pl.DataFrame, recommendations: dict[int, list[int]], k: int):
+    """
+    Row of every (itemid, event) key and the top k items of the rows for every label type
+    recommendations are the items recommended to a session with the single event of the key at that position of
+    keys_df. Returns rows: (items, event types) row of the key or -1, and items: (keys, label types, k) item ids, -1
+    where there are fewer than k recommendations. Both are int64, so every UInt32 item id fits next to the -1.
+    """
+    itemids = keys_df.get_column("itemid").to_numpy()
+    events = keys_df.get_column("event").replace_strict(
+        {event: code for code, event in enumerate(EVENT_TYPES)}, return_dtype=pl.Int64).to_numpy()
+    rows = np.full((int(itemids.max()) + 1 if len(itemids) else 0, len(EVENT_TYPES)), -1, dtype=np.int64)
+    rows[itemids, events] = np.arange(len(itemids))
+
+    items = np.full((len(itemids), len(LABEL_TYPES), k), -1, dtype=np.int64)
+    for position, position_items in recommendations.items():
+        items[position, :, :len(position_items[:k])] = position_items[:k]
+    return rows, items
+
+
+@beartype
+def write_cache(rows: np.ndarray, items: np.ndarray, metadata: dict, path: Path):
+    """
+    Save the cache table to the directory path, replacing an existing cache as a whole
+    """
+    tmp_path = temporary_directory(path)
+    tmp_path.mkdir(parents=True)
+    np.save(tmp_path / "rows.npy", rows)
+    np.save(tmp_path / "items.npy", items)
+    (tmp_path / "cache.json").write_text(json.dumps(metadata))
+    replace_directory(tmp_path, path)
+
+
+class RecommendationCache:
+    """
+    Memory-mapped top k recommendations of single event sessions by item id and event type
+    The lookups of single event sessions are counted as hits or misses.
+    """
+
+    def __init__(self, path: Path):
+        self.rows = np.load(path / "rows.npy", mmap_mode="r")
+        self.items = np.load(path / "items.npy", mmap_mode="r")
+        self.metadata = json.loads((path / "cache.json").read_text())
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def k(self):
+        return self.items.shape[2]
+
+    def check(self, model: str, options: dict, k: int):
+        """
+        Raise ValueError if the cache was built by another model, with other options or fewer items
+        """
+        if self.metadata["model"] != model or self.metadata["options"] != options:
+            raise ValueError(f"The cache was built by {self.metadata['model']} with {self.metadata['options']}, "
+                             f"not by {model} with {options}")
+        if k > self.k:
+            raise ValueError(f"The cache has the top {self.k} items, not the top {k}")
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    def counters(self):
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate()}
+
+    def lookup(self, itemid: int, event: str, k: int):
+        """
+        Top k items of a session with a single event for every label type, None if the key is not cached
+        """
+        code = EVENT_TYPES.index(event)
+        row = self.rows[itemid, code] if 0 <= itemid < len(self.rows) else -1
+        if row < 0:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {label_type: [item for item in self.items[row, index, :k].tolist() if item >= 0]
+                for index, label_type in enumerate(LABEL_TYPES)}
+
+    def lookup_sessions(self, events_df: pl.DataFrame, k: int):
+        """
+        Predictions of the cached single event sessions of a batch, and the events of the other sessions
+        """
+        single_df = (
+            events_df
+            .group_by("session")
+            .agg(pl.len(), pl.col("itemid").first().cast(pl.Int64), pl.col("event").first().cast(pl.String))
+            .filter(pl.col("len") == 1)
+        )
+        sessions = single_df.get_column("session").to_numpy()
+        itemids = single_df.get_column("itemid").to_numpy()
+        codes = single_df.get_column("event").replace_strict(
+            {event: code for code, event in enumerate(EVENT_TYPES)}, return_dtype=pl.Int64).to_numpy()
+        known = (itemids >= 0) & (itemids < len(self.rows))
+        rows = np.full(len(sessions), -1, dtype=np.int64)
+        rows[known] = self.rows[itemids[known], codes[known]]
+        hit = rows >= 0
+        self.hits += int(hit.sum())
+        self.misses += int((~hit).sum())
+
+        items = self.items[rows[hit], :, :k]
+        predictions = {
+            session: {label_type: [item for item in session_items[index] if item >= 0]
+                      for index, label_type in enumerate(LABEL_TYPES)}
+            for session, session_items in zip(sessions[hit].tolist(), items.tolist())
+        }
+        return predictions, events_df.filter(~pl.col("session").is_in(sessions[hit].tolist()))
+
+
+class CachedRecommender:
+    """
+    Online recommender answering sessions with a single event from the cache and other sessions from the recommender
+    All events are passed on to the recommender, so its state is up to date once the session has more events.
+    """
+
+    def __init__(self, recommender, cache: RecommendationCache, label_type: str = "addtocart"):
+        self.recommender = recommender
+        self.cache = cache
+        self.label_type = label_type
+
+    def start_session(self, session: int):
+        self.recommender.start_session(session)
+        self.events = []
+
+    def update(self, event: dict):
+        self.recommender.update(event)
+        self.events.append(event)
+
+    def recommend(self, k: int):
+        if len(self.events) == 1:
+            items = self.cache.lookup(int(self.events[0]["itemid"]), self.events[0]["event"], k)
+            if items is not None:
+                return items[self.label_type]
+        return self.recommender.recommend(k)
+
+
+@beartype
+def main(train_set_path: Path, output_path: Path, model: str = "markov", k: int = 20, options: dict | None = None,
+         batch_size: int = 10000):
+    # The models are imported here, they import this module for their cached prediction paths
+    from src.models import markov, session_knn
+
+    if model not in MODEL_OPTIONS:
+        raise ValueError(f"Unknown model {model}")
+    options = {**MODEL_OPTIONS[model], **(options or {})}
+    print("Reading the train set")
+    train_df = read_sessions(sessions_file(train_set_path, 'train_set'), columns=["timestamp", "event", "itemid",
+                                                                                   "session"])
+    keys_df = cache_keys(train_df)
+    # Every key is scored as a session of its own with a single event
+    key_sessions_df = keys_df.with_columns(session=pl.int_range(pl.len()), timestamp=pl.lit(0))
+
+    print(f"Scoring {keys_df.height} (itemid, event) pairs")
+    if model == "markov":
+        matrix = markov.build_transition_matrix(train_df, options["max_next_items"])
+        recommendations = {}
+        for chunk_df in iter_session_chunks(key_sessions_df, batch_size):
+            recommendations.update(markov.score_sessions(matrix, chunk_df, k))
+    elif model == "knn":
+        index = session_knn.build_session_index(train_df, options["max_sessions_per_item"])
+        # The session-kNN recommendations only depend on the item, so every item is scored once
+        items = keys_df.get_column("itemid").unique(maintain_order=True).to_list()
+        item_recommendations = session_knn.predict(index, [(itemid, [itemid]) for itemid in items], k,
+                                                   options["sample_size"], options["neighbours"])
+        recommendations = {position: item_recommendations[itemid]
+                           for position, itemid in enumerate(keys_df.get_column("itemid").to_list())}
+
+    print("Saving the cache")
+    rows, items = build_cache_table(keys_df, recommendations, k)
+    write_cache(rows, items, {"model": model, "options": options}, output_path)
+
+    print("Done")
+
+
+@beartype
+def cli(argv: list[str] | None = None, prog: str | None = None):
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--train-set-path', type=Path, required=True)
+    parser.add_argument('--output-path', type=Path, required=True, help='Directory of the cache to write')
+    parser.add_argument('--model', choices=sorted(MODEL_OPTIONS), default="markov")
+    parser.add_argument('--k', type=int, default=20, help='Number of cached items of every key')
+    parser.add_argument('--max-next-items', type=int, default=100, help='Next items kept for every item (markov)')
+    parser.add_argument('--max-sessions-per-item', type=int, default=1000,
+                        help='Most recent train sessions kept in the posting list of an item (knn)')
+    parser.add_argument('--sample-size', type=int, default=500,
+                        help='Most recent candidate sessions scored for a test session (knn)')
+    parser.add_argument('--neighbours', type=int, default=100,
+                        help='Number of neighbour sessions voting for items (knn)')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Number of keys scored at a time')
+    args = parser.parse_args(argv)
+    options = {option: getattr(args, option) for option in MODEL_OPTIONS[args.model]}
+    main(args.train_set_path, args.output_path, args.model, args.k, options, args.batch_size)
+
+
+if __name__ == '__main__':
+    cli()
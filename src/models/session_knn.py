@@ -0,0 +1,196 @@
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import polars as pl
+from beartype import beartype
+
+from src.data_generation.schema import read_sessions, read_test_sessions, sessions_file
+from src.evaluate import LABEL_TYPES
+from src.models.io import write_predictions
+from src.models.recommendation_cache import RecommendationCache
+from src.models.sparse import csr_indptr, csr_offsets
+
+
+class SessionIndex(NamedTuple):
+    """
+    Train sessions and the inverted index from items to the train sessions containing them as flat offset/array pairs
+    item_indptr: (items + 1,) offsets of the posting lists of the items
+    item_sessions: train session positions of the posting lists, the most recent sessions first
+    session_indptr: (sessions + 1,) offsets of the distinct items of the train sessions
+    session_items: distinct items of the train sessions
+    session_timestamps: last timestamp of every train session
+    popular: items in the most train sessions, recommended when a session has fewer scored items
+    """
+    item_indptr: np.ndarray
+    item_sessions: np.ndarray
+    session_indptr: np.ndarray
+    session_items: np.ndarray
+    session_timestamps: np.ndarray
+    popular: np.ndarray
+
+
+@beartype
+def build_session_index(sessions_df: pl.DataFrame, max_sessions_per_item: int = 1000, num_popular: int = 100):
+    """
+    Index the distinct items of the train sessions, keeping the max_sessions_per_item most recent sessions of an item
+    """
+    session_items_df = (
+        sessions_df
+        .group_by("session", pl.col("itemid").cast(pl.Int64))
+        .agg(pl.col("timestamp").max())
+        .with_columns(last_timestamp=pl.col("timestamp").max().over("session"))
+        .with_columns(position=pl.col("session").rank("dense").cast(pl.Int64) - 1)
+    )
+    num_sessions = session_items_df.select(pl.col("position").max()).item() + 1 if session_items_df.height else 0
+    num_items = session_items_df.select(pl.col("itemid").max()).item() + 1 if session_items_df.height else 0
+
+    by_session = session_items_df.sort(["position", "itemid"])
+    session_timestamps = (
+        by_session.group_by("position", maintain_order=True).agg(pl.col("last_timestamp").first())
+        .get_column("last_timestamp").to_numpy()
+    )
+    by_item = (
+        session_items_df
+        .sort(["itemid", "last_timestamp", "position"], descending=[False, True, False])
+        .filter(pl.int_range(pl.len()).over("itemid") < max_sessions_per_item)
+    )
+    popular = (
+        session_items_df.group_by("itemid").agg(sessions=pl.len())
+        .sort(["sessions", "itemid"], descending=[True, False])
+        .head(num_popular)
+        .get_column("itemid").to_numpy()
+    )
+    return SessionIndex(
+        csr_indptr(by_item.get_column("itemid").to_numpy(), num_items), by_item.get_column("position").to_numpy(),
+        csr_indptr(by_session.get_column("position").to_numpy(), num_sessions),
+        by_session.get_column("itemid").to_numpy(), session_timestamps, popular
+    )
+
+
+@beartype
+def recommend(index: SessionIndex, items: list[int], k: int = 20, sample_size: int = 500, num_neighbours: int = 100):
+    """
+    Top k items of the neighbour sessions of a test session
+    The candidate neighbours are the union of the posting lists of the session items, of which only the sample_size
+    most recent are scored. The num_neighbours candidates with the highest cosine similarity of the item sets vote for
+    their items with their similarity.
+    """
+    items = np.unique(np.array(items, dtype=np.int64))
+    items = items[items < len(index.item_indptr) - 1]
+    positions, _ = csr_offsets(index.item_indptr, items)
+    # A candidate appears once in the posting list of every session item it contains
+    candidates, overlaps = np.unique(index.item_sessions[positions], return_counts=True)
+    if len(candidates) > sample_size:
+        recent = np.argsort(-index.session_timestamps[candidates], kind="stable")[:sample_size]
+        candidates, overlaps = candidates[recent], overlaps[recent]
+
+    lengths = index.session_indptr[candidates + 1] - index.session_indptr[candidates]
+    similarities = overlaps / np.sqrt(len(items) * lengths)
+    if len(candidates) > num_neighbours:
+        nearest = np.argsort(-similarities, kind="stable")[:num_neighbours]
+        candidates, similarities = candidates[nearest], similarities[nearest]
+
+    positions, owners = csr_offsets(index.session_indptr, candidates)
+    neighbour_items, inverse = np.unique(index.session_items[positions], return_inverse=True)
+    scores = np.bincount(inverse, weights=similarities[owners], minlength=len(neighbour_items))
+    recommendations = neighbour_items[np.lexsort((neighbour_items, -scores))[:k]].tolist()
+    if len(recommendations) < k:
+        recommendations += [item for item in index.popular.tolist() if item not in recommendations][
+                           :k - len(recommendations)]
+    return recommendations
+
+
+# Index shared by the worker processes, set once per worker by the pool initializer
+_worker_index = None
+
+
+def _init_worker(index: SessionIndex):
+    global _worker_index
+    _worker_index = index
+
+
+def _recommend_batch(sessions: list[tuple], k: int, sample_size: int, num_neighbours: int):
+    return {session: recommend(_worker_index, items, k, sample_size, num_neighbours) for session, items in sessions}
+
+
+@beartype
+def predict(index: SessionIndex, sessions: list[tuple], k: int = 20, sample_size: int = 500,
+            num_neighbours: int = 100, workers: int = 1, batch_size: int = 1000):
+    """
+    Recommendations of (session, items) pairs, scored in batches of batch_size sessions by worker processes
+    """
+    batches = [sessions[start:start + batch_size] for start in range(0, len(sessions), batch_size)]
+    options = (k, sample_size, num_neighbours)
+    if workers == 1:
+        _init_worker(index)
+        results = [_recommend_batch(batch, *options) for batch in batches]
+    else:
+        # polars is not fork safe, so the workers are spawned
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(index,)) as executor:
+            results = list(executor.map(_recommend_batch, batches, *[repeat(option) for option in options]))
+    return {session: items for result in results for session, items in result.items()}
+
+
+@beartype
+def main(train_set_path: Path, test_sessions_path: Path, output_path: Path, k: int = 20,
+         max_sessions_per_item: int = 1000, sample_size: int = 500, num_neighbours: int = 100, workers: int = 1,
+         batch_size: int = 1000, cache_path: Path | None = None):
+    cache = None
+    if cache_path is not None:
+        cache = RecommendationCache(cache_path)
+        cache.check("knn", {"max_sessions_per_item": max_sessions_per_item, "sample_size": sample_size,
+                            "neighbours": num_neighbours}, k)
+
+    print("Building the session index")
+    train_df = read_sessions(sessions_file(train_set_path, 'train_set'), columns=["timestamp", "itemid", "session"])
+    index = build_session_index(train_df, max_sessions_per_item)
+
+    print("Scoring the test sessions")
+    test_df = read_test_sessions(test_sessions_path)
+    predictions = {}
+    if cache is not None:
+        predictions, test_df = cache.lookup_sessions(test_df, k)
+        print(f"Cache {cache.counters()}")
+    test_sessions = (
+        test_df
+        .group_by("session", maintain_order=True)
+        .agg(pl.col("itemid").cast(pl.Int64))
+        .rows()
+    )
+    recommendations = predict(index, test_sessions, k, sample_size, num_neighbours, workers, batch_size)
+    predictions.update({session: {event_type: items for event_type in LABEL_TYPES}
+                        for session, items in recommendations.items()})
+    write_predictions(predictions, output_path)
+
+    print("Done")
+
+
+@beartype
+def cli(argv: list[str] | None = None, prog: str | None = None):
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--train-set-path', type=Path, required=True)
+    parser.add_argument('--test-sessions', type=Path, required=True, help='test_sessions.jsonl of testset_labels')
+    parser.add_argument('--output-path', type=Path, required=True, help='Predictions file to write')
+    parser.add_argument('--k', type=int, default=20, help='Number of recommended items')
+    parser.add_argument('--max-sessions-per-item', type=int, default=1000,
+                        help='Most recent train sessions kept in the posting list of an item')
+    parser.add_argument('--sample-size', type=int, default=500,
+                        help='Most recent candidate sessions scored for a test session')
+    parser.add_argument('--neighbours', type=int, default=100, help='Number of neighbour sessions voting for items')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes scoring the test sessions')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Number of sessions scored per task')
+    parser.add_argument('--cache-path', type=Path, default=None,
+                        help='Recommendation cache of src.models.recommendation_cache for single event sessions')
+    args = parser.parse_args(argv)
+    main(args.train_set_path, args.test_sessions, args.output_path, args.k, args.max_sessions_per_item,
+         args.sample_size, args.neighbours, args.workers, args.batch_size, args.cache_path)
+
+
+if __name__ == '__main__':
+    cli()
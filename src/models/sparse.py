@@ -0,0 +1,23 @@
+import numpy as np
+from beartype import beartype
+
+
+@beartype
+def csr_offsets(indptr: np.ndarray, rows: np.ndarray):
+    """
+    Rows of a CSR matrix gathered at once: rows[i] as a row pointer plus position in the index arrays of every value of
+    the gathered rows, and the index i of the row each value belongs to
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    owners = np.repeat(np.arange(len(rows)), lengths)
+    positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+    return positions, owners
+
+
+@beartype
+def csr_indptr(rows: np.ndarray, num_rows: int):
+    """
+    Row pointers of a CSR matrix from the row of every value, the values sorted by row
+    """
+    return np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=num_rows))]).astype(np.int64)
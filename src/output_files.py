@@ -0,0 +1,30 @@
+import shutil
+from pathlib import Path
+
+from beartype import beartype
+
+
+@beartype
+def temporary_directory(path: Path):
+    """
+    Path of a sibling directory, removed if a failed run left it behind, to write the contents of path to before
+    replace_directory moves it in place
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    return tmp_path
+
+
+@beartype
+def replace_directory(tmp_path: Path, path: Path):
+    """
+    Replace the directory path as a whole by tmp_path, the old directory is removed once the new one is in place
+    """
+    if path.exists():
+        old_path = path.with_name(path.name + ".old")
+        path.rename(old_path)
+        tmp_path.rename(path)
+        shutil.rmtree(old_path)
+    else:
+        tmp_path.rename(path)
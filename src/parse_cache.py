@@ -0,0 +1,103 @@
+import gc
+import os
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+from beartype import beartype
+
+CACHE_VERSION = 1
+
+
+@beartype
+def cache_path(source: Path):
+    return source.with_name(source.name + ".cache.npy")
+
+
+@beartype
+def source_signature(source: Path):
+    stat = source.stat()
+    return [CACHE_VERSION, stat.st_size, stat.st_mtime_ns]
+
+
+@beartype
+def write_cache(source: Path, parsed: dict[int, dict], keys: tuple[str, ...]):
+    """
+    Save parsed sessions as a single int64 array next to the source file
+    Layout: version, source size, source mtime, number of sessions, session ids, and for each key a presence flag for
+    every session, the offsets of the item lists of the sessions and the concatenated item lists.
+    """
+    sessions = list(parsed)
+    parts = [np.array(source_signature(source) + [len(sessions)], dtype=np.int64), np.array(sessions, dtype=np.int64)]
+    for key in keys:
+        item_lists = [parsed[session].get(key) for session in sessions]
+        parts.append(np.array([items is not None for items in item_lists], dtype=np.int64))
+        lengths = np.array([len(items) if items is not None else 0 for items in item_lists], dtype=np.int64)
+        parts.append(np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64))
+        parts.append(np.fromiter((item for items in item_lists if items for item in items), dtype=np.int64,
+                                 count=int(lengths.sum())))
+
+    temporary_path = cache_path(source).with_suffix(".tmp")
+    with open(temporary_path, "wb") as f:
+        np.save(f, np.concatenate(parts))
+    os.replace(temporary_path, cache_path(source))
+
+
+@beartype
+def read_cache(source: Path, keys: tuple[str, ...], container: type = list):
+    """
+    Memory-map the cache of the source file and convert it back to parsed sessions
+    Returns None if there is no cache or the source file has changed since the cache was written.
+    """
+    if not cache_path(source).exists():
+        return None
+    data = np.load(cache_path(source), mmap_mode="r")
+    signature = source_signature(source)
+    if data[:len(signature)].tolist() != signature:
+        return None
+
+    position = len(signature)
+    num_sessions = int(data[position])
+    position += 1
+    sessions = data[position:position + num_sessions].tolist()
+    position += num_sessions
+
+    # Building millions of small containers triggers the cyclic garbage collector repeatedly without freeing anything
+    gc.disable()
+    try:
+        return _parsed_from_arrays(data, position, num_sessions, sessions, keys, container)
+    finally:
+        gc.enable()
+
+
+def _parsed_from_arrays(data: np.ndarray, position: int, num_sessions: int, sessions: list[int],
+                        keys: tuple[str, ...], container: type):
+    values_by_key = []
+    for key in keys:
+        present = data[position:position + num_sessions].tolist()
+        position += num_sessions
+        offsets = data[position:position + num_sessions + 1].tolist()
+        position += num_sessions + 1
+        items = data[position:position + offsets[-1]].tolist()
+        position += offsets[-1]
+        values_by_key.append([
+            container(items[start:end]) if is_present else None
+            for is_present, start, end in zip(present, offsets, offsets[1:])
+        ])
+
+    return {
+        session: {key: value for key, value in zip(keys, values) if value is not None}
+        for session, *values in zip(sessions, *values_by_key)
+    }
+
+
+@beartype
+def load_cached(source: Path, parse: Callable[[Path], dict], keys: tuple[str, ...], container: type = list):
+    """
+    Parsed sessions of the source file from its cache, parsing the source and writing the cache if it is stale
+    """
+    parsed = read_cache(source, keys, container)
+    if parsed is None:
+        parsed = parse(source)
+        write_cache(source, parsed, keys)
+    return parsed
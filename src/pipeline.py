@@ -0,0 +1,97 @@
+import argparse
+from pathlib import Path
+
+import polars as pl
+from beartype import beartype
+
+from src.data_generation.product_category_tree import create_item_categories, get_max_ts
+from src.data_generation.schema import EVENT_ENUM, encode_itemids, last_event_timestamp, read_sessions, sessions_file
+from src.data_generation.testset_labels import split_test_df
+from src.data_generation.train_test_split import (collapse_repeated_events, create_sessions, create_train_test_split,
+                                                  create_train_test_split_contiguous, read_events, write_datasets)
+
+STAGES = ["split", "labels", "categories"]
+
+
+@beartype
+def main(input_path: Path, output_path: Path, train_weeks: int = 3, test_weeks: int = 2, seed: int = 42,
+         stages: list[str] | None = None, contiguous_split: bool = False, compact_schema: bool = False,
+         chunk_size: int | None = None, collapse_repeats: bool = False):
+    """
+    Run the train/test split, test set labels and item categories stages in one process
+    The DataFrames are handed directly from stage to stage and the outputs are written at the end. Stages that are
+    not selected are skipped and the selected stages read the outputs of the skipped ones from the output path.
+    """
+    stages = STAGES if stages is None else stages
+
+    if "split" in stages:
+        print("Reading the dataset")
+        events_df = read_events(input_path)
+        if compact_schema:
+            events_df = encode_itemids(events_df, output_path).with_columns(pl.col("event").cast(EVENT_ENUM))
+
+        print("Creating sessions")
+        sessions_df = create_sessions(events_df)
+        del events_df
+
+        print("Creating train and test datasets")
+        split = create_train_test_split_contiguous if contiguous_split else create_train_test_split
+        train_df, test_df = split(sessions_df, train_weeks, test_weeks)
+        del sessions_df
+        if collapse_repeats:
+            train_df = collapse_repeated_events(train_df.sort(["session", "timestamp"], maintain_order=True))
+            test_df = collapse_repeated_events(test_df.sort(["session", "timestamp"], maintain_order=True))
+        # Same as get_max_ts reading the saved train set
+        max_ts = train_df.select(last_event_timestamp(train_df.columns)).max().item()
+        # The separate stages read numeric item ids back from the CSV files as integers
+        try:
+            test_df = test_df.with_columns(pl.col("itemid").cast(pl.Int64, strict=True))
+        except pl.exceptions.InvalidOperationError:
+            pass
+    else:
+        test_df = read_sessions(sessions_file(output_path, 'test_set')) if "labels" in stages else None
+        max_ts = get_max_ts(output_path) if "categories" in stages else None
+
+    if "categories" in stages:
+        print("Creating item categories")
+        test_start = max_ts - test_weeks*7*24*60*60
+        train_start = test_start - train_weeks*7*24*60*60
+        item_categories_df = create_item_categories(input_path, train_start, test_start)
+
+    print("Saving the datasets")
+    if "split" in stages:
+        write_datasets(train_df, test_df, output_path, compact_schema)
+    if "labels" in stages:
+        split_test_df(test_df, output_path, seed, chunk_size)
+    if "categories" in stages:
+        item_categories_df.write_csv(output_path / "item_categories.csv")
+
+    print("Done")
+
+
+@beartype
+def cli(argv: list[str] | None = None, prog: str | None = None):
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--input-path', type=Path, required=True,
+                        help='Directory of the events, category_tree.csv and item_properties files')
+    parser.add_argument('--output-path', type=Path, required=True)
+    parser.add_argument('--train-weeks', type=int, default=3)
+    parser.add_argument('--test-weeks', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--stages', type=str, nargs='+', default=None, choices=STAGES,
+                        help='Run only these stages, all by default')
+    parser.add_argument('--contiguous-split', action='store_true',
+                        help='Use the train/test split that relies on the sessions being sorted and contiguous')
+    parser.add_argument('--compact-schema', action='store_true',
+                        help='Use UInt32 item ids and enum events, and save the datasets as Parquet')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='Convert the test sessions to Python objects in chunks of this many sessions')
+    parser.add_argument('--collapse-repeats', action='store_true',
+                        help='Collapse consecutive events of a session with the same item and event type')
+    args = parser.parse_args(argv)
+    main(args.input_path, args.output_path, args.train_weeks, args.test_weeks, args.seed, args.stages,
+         args.contiguous_split, args.compact_schema, args.chunk_size, args.collapse_repeats)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,218 @@
+import argparse
+import heapq
+import json
+import time
+from pathlib import Path
+from typing import NamedTuple, Protocol, runtime_checkable
+
+import numpy as np
+import polars as pl
+from beartype import beartype
+from tqdm.auto import tqdm
+
+from src.data_generation.schema import read_sessions, sessions_file
+from src.data_generation.testset_labels import iter_session_chunks, prefix_labels, squeeze_sessions
+from src.evaluate import (DEFAULT_CUTOFFS, LABEL_TYPES, default_cutoffs, metrics_from_ranked, rank_event_types,
+                          segment_breakdown)
+from src.models.markov import EVENT_WEIGHTS, TransitionMatrix, build_transition_matrix, load_transition_matrix
+from src.models.recommendation_cache import CachedRecommender, RecommendationCache
+
+# Upper bounds in microseconds of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS_US = [10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+@runtime_checkable
+class Recommender(Protocol):
+    """
+    Online recommender fed the events of a session one at a time
+    """
+
+    def start_session(self, session: int) -> None:
+        ...
+
+    def update(self, event: dict) -> None:
+        ...
+
+    def recommend(self, k: int) -> list[int]:
+        ...
+
+
+class MarkovRecommender:
+    """
+    Transition model scores of a session, updated incrementally for every event
+    The scores of the earlier events decay by recency_decay for every event. Instead of rescaling all scores, the
+    weight of a new event is divided by the accumulated decay, so an update only touches the row of the new item.
+    Unlike score_sessions all events of the session are scored, not only the last max_events.
+    """
+
+    def __init__(self, matrix: TransitionMatrix, recency_decay: float = 0.8):
+        self.matrix = matrix
+        self.recency_decay = recency_decay
+        self.popular = matrix.popular.tolist()
+        self.start_session(0)
+
+    def start_session(self, session: int):
+        self.scores = {}
+        self.scale = 1.
+
+    def update(self, event: dict):
+        self.scale *= self.recency_decay
+        if self.scale < 1e-100:
+            self.scores = {item: score * self.scale for item, score in self.scores.items()}
+            self.scale = 1.
+        itemid = int(event["itemid"])
+        # Items not in the train set have no transitions
+        if itemid >= len(self.matrix.indptr) - 1:
+            return
+        start, end = self.matrix.indptr[itemid], self.matrix.indptr[itemid + 1]
+        weight = EVENT_WEIGHTS.get(event["event"], 1.) / self.scale
+        for item, probability in zip(self.matrix.indices[start:end].tolist(), self.matrix.data[start:end].tolist()):
+            self.scores[item] = self.scores.get(item, 0.) + probability * weight
+
+    def recommend(self, k: int):
+        top = [item for item, _ in heapq.nsmallest(k, self.scores.items(), key=lambda score: (-score[1], score[0]))]
+        if len(top) < k:
+            top += [item for item in self.popular if item not in self.scores][:k - len(top)]
+        return top
+
+
+class ReplayResult(NamedTuple):
+    """
+    Recommendations after every event of the replayed sessions
+    labels: labels of every prefix with labels, keyed by prefix id
+    predictions: recommendations of the prefixes with labels for every event type
+    prefix_lengths: number of events of the prefixes
+    latencies: (events,) nanoseconds of the update and recommendation of every event
+    """
+    labels: dict[int, dict]
+    predictions: dict[int, dict]
+    prefix_lengths: dict[int, int]
+    latencies: np.ndarray
+
+
+@beartype
+def replay(recommender: Recommender, test_df: pl.DataFrame, k: int = 20, chunk_size: int = 10000,
+           max_sessions: int | None = None):
+    """
+    Feed the events of the test sessions one at a time to the recommender and keep its top k after every event
+    The labels of a prefix are the items added to cart or purchased after it, computed by prefix_labels in one
+    reverse pass over each session that shares the label lists between prefixes instead of copying them. The last
+    event of a session has no later labels and is not replayed.
+    """
+    test_df = test_df.sort(["session", "timestamp"], maintain_order=True)
+    if max_sessions is not None:
+        test_df = test_df.filter(pl.col("session").rle_id() < max_sessions)
+
+    labels, predictions, prefix_lengths, latencies = {}, {}, {}, []
+    for chunk_df in tqdm(iter_session_chunks(test_df, chunk_size), desc="Replaying sessions"):
+        for session, events in squeeze_sessions(chunk_df).rows():
+            if len(events) < 2:
+                continue
+            session_labels = {
+                prefix_length: {event_type: items for event_type, items in zip(LABEL_TYPES, (carts, orders)) if items}
+                for prefix_length, carts, orders in prefix_labels(events)
+            }
+            recommender.start_session(session)
+            for prefix_length, event in enumerate(events[:-1], start=1):
+                start = time.perf_counter_ns()
+                recommender.update(event)
+                items = recommender.recommend(k)
+                latencies.append(time.perf_counter_ns() - start)
+                if prefix_length in session_labels:
+                    prefix = len(labels)
+                    labels[prefix] = session_labels[prefix_length]
+                    predictions[prefix] = {event_type: items for event_type in LABEL_TYPES}
+                    prefix_lengths[prefix] = prefix_length
+    return ReplayResult(labels, predictions, prefix_lengths, np.array(latencies, dtype=np.int64))
+
+
+@beartype
+def latency_histogram(latencies: np.ndarray):
+    """
+    Number of events in each latency bucket, with the mean and percentiles in microseconds
+    """
+    latencies_us = latencies / 1000
+    bounds = [0] + LATENCY_BUCKETS_US
+    names = [f"{low}-{high}us" for low, high in zip(bounds, bounds[1:])] + [f"{bounds[-1]}us+"]
+    counts = np.bincount(np.searchsorted(LATENCY_BUCKETS_US, latencies_us, side="right"), minlength=len(names))
+    summary = {"events": len(latencies)}
+    if len(latencies):
+        summary["mean_us"] = float(latencies_us.mean())
+        for percentile in (50, 90, 99):
+            summary[f"p{percentile}_us"] = float(np.percentile(latencies_us, percentile))
+    summary["histogram"] = dict(zip(names, counts.tolist()))
+    return summary
+
+
+@beartype
+def replay_report(result: ReplayResult, cutoffs: list[int] | None = None):
+    """
+    Recall and MRR of all prefixes and by label type and prefix length, and the latency histogram
+    """
+    cutoffs = default_cutoffs(cutoffs)
+    ranked_by_type = rank_event_types(result.labels, result.predictions, max(cutoffs))
+    breakdown = segment_breakdown(ranked_by_type, cutoffs, result.labels, result.prefix_lengths)
+    for event_breakdown in breakdown.values():
+        event_breakdown["prefix_length"] = event_breakdown.pop("session_length")
+    return {
+        "prefixes": len(result.labels),
+        "metrics": metrics_from_ranked(ranked_by_type, cutoffs, ["recall", "mrr"], None),
+        "breakdown": breakdown,
+        "latency": latency_histogram(result.latencies),
+    }
+
+
+@beartype
+def main(train_set_path: Path, test_set_path: Path, cutoffs: list[int] | None = None, max_next_items: int = 100,
+         recency_decay: float = 0.8, model_path: Path | None = None, max_sessions: int | None = None,
+         chunk_size: int = 10000, output_path: Path | None = None, cache_path: Path | None = None):
+    cutoffs = default_cutoffs(cutoffs)
+    if model_path is not None:
+        matrix = load_transition_matrix(model_path)
+    else:
+        print("Building the transition matrix")
+        train_df = read_sessions(sessions_file(train_set_path, 'train_set'),
+                                 columns=["timestamp", "event", "itemid", "session"])
+        matrix = build_transition_matrix(train_df, max_next_items)
+
+    test_df = read_sessions(test_set_path, columns=["timestamp", "event", "itemid", "session"])
+    recommender = MarkovRecommender(matrix, recency_decay)
+    if cache_path is not None:
+        cache = RecommendationCache(cache_path)
+        cache.check("markov", {"max_next_items": max_next_items}, max(cutoffs))
+        recommender = CachedRecommender(recommender, cache)
+    result = replay(recommender, test_df, max(cutoffs), chunk_size, max_sessions)
+    report = replay_report(result, cutoffs)
+    if cache_path is not None:
+        report["cache"] = cache.counters()
+
+    print(json.dumps(report, indent=2))
+    if output_path is not None:
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+@beartype
+def cli(argv: list[str] | None = None, prog: str | None = None):
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--train-set-path', type=Path, required=True)
+    parser.add_argument('--test-set', type=Path, required=True,
+                        help='Sessionized test set of train_test_split, a file or partitioned directory')
+    parser.add_argument('--cutoffs', default=list(DEFAULT_CUTOFFS), type=int, nargs='+')
+    parser.add_argument('--max-next-items', type=int, default=100, help='Next items kept for every item')
+    parser.add_argument('--recency-decay', type=float, default=0.8,
+                        help='Weight decay of the transitions of an event for every later event of the session')
+    parser.add_argument('--model-path', type=Path, default=None,
+                        help='Load the transition matrix saved by src.models.markov instead of building it')
+    parser.add_argument('--max-sessions', type=int, default=None, help='Replay only the first sessions')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Number of sessions read at a time')
+    parser.add_argument('--output', type=Path, default=None, help='Save the report as JSON to this file')
+    parser.add_argument('--cache-path', type=Path, default=None,
+                        help='Recommendation cache of src.models.recommendation_cache for the first event of a session')
+    args = parser.parse_args(argv)
+    main(args.train_set_path, args.test_set, args.cutoffs, args.max_next_items, args.recency_decay, args.model_path,
+         args.max_sessions, args.chunk_size, args.output, args.cache_path)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,15 @@
+import polars as pl
+import pytest
+
+
+@pytest.fixture
+def train_df():
+    """
+    Train sessions with the transitions 1->2 (twice), 2->1, 1->3 and 5->4
+    """
+    return pl.DataFrame({
+        "timestamp": [1, 2, 3, 4, 1, 2, 1, 2],
+        "event": ["view", "view", "view", "addtocart", "view", "view", "view", "view"],
+        "itemid": [1, 2, 1, 3, 1, 2, 5, 4],
+        "session": [1, 1, 1, 1, 2, 2, 3, 3]
+    })
@@ -0,0 +1,33 @@
+import importlib
+import subprocess
+import sys
+
+import pytest
+
+from src.__main__ import COMMANDS, main
+
+
+class TestCli:
+
+    def test_help_does_not_import_subcommands(self):
+        code = ("import sys\nfrom src.__main__ import main\ntry:\n    main(['--help'])\nexcept SystemExit:\n    pass\n"
+                "print(sorted(module for module in ('polars', 'numpy', 'beartype', 'tqdm') if module in sys.modules))")
+
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+        assert result.stdout.splitlines()[-1] == "[]"
+
+    def test_subcommand_options_are_parsed_by_the_module(self, tmp_path, capsys):
+        (tmp_path / "test_labels.jsonl").write_text('{"session": 1, "labels": {"addtocart": [3]}}\n')
+        (tmp_path / "predictions.csv").write_text("session_type,labels\n1_addtocart,3 4\n")
+
+        main(["evaluate", "--test-labels", str(tmp_path / "test_labels.jsonl"), "--predictions",
+              str(tmp_path / "predictions.csv"), "--cutoffs", "1", "--metrics", "recall"])
+
+        assert '"recall@1": 1.0' in capsys.readouterr().out
+        with pytest.raises(SystemExit):
+            main(["evaluate", "--unknown-option"])
+
+    def test_every_subcommand_has_a_cli(self):
+        for module, _ in COMMANDS.values():
+            assert callable(importlib.import_module(module).cli), module
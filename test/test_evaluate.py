@@ -1,4 +1,11 @@
-from src.evaluate import (evaluate_session, evaluate_sessions, get_scores, num_events, recall_by_event_type, mrr_by_event_type)
+import math
+
+import numpy as np
+import pytest
+
+from src.evaluate import (bootstrap_intervals, comparison_table, compute_metrics, evaluate_models, evaluate_session,
+                          evaluate_sessions, find_predictions_files, get_scores, num_events, rank_event_types,
+                          read_labels, read_predictions, sample_sessions, sampled_estimates, recall_by_event_type, mrr_by_event_type, segment_breakdown)
 
 
 class TestEvaluate:
@@ -316,3 +323,239 @@ class TestEvaluate:
 
         assert expected_evaluated_events == evaluate_sessions(labels, predictions, k)
         assert expected_scores == get_scores(labels, predictions, k)
+
+
+class TestComputeMetrics:
+
+    predictions = {
+        1: {
+            'addtocart': [1, 2, 3],
+            'transaction': [1, 32, 33]
+        },
+        2: {
+            'addtocart': [1000004, 2, 3, 1000007],
+            'transaction': [1, 2, 3]
+        },
+        3: {
+            'addtocart': [1000007, 1000004, 3],
+            'transaction': [1, 2, 3]
+        }
+    }
+    labels = {
+        1: {
+            'addtocart': set(),
+            'transaction': {0, 1, 2, 3, 4, 5, 16, 17, 18, 19, 20}
+        },
+        2: {
+            'addtocart': {1000000, 1000004, 1000007},
+            'transaction': {1000000, 1000004}
+        },
+        3: {
+            'addtocart': {1000000, 1000004, 1000007},
+            'transaction': set()
+        },
+        4: {
+            'addtocart': {1000000, 1000004, 1000007},
+            'transaction': set()
+        }
+    }
+
+    def test_recall_matches_get_scores(self):
+        recalls, _ = get_scores(self.labels, self.predictions, 3)
+        scores = compute_metrics(self.labels, self.predictions, [3], ['recall'])
+
+        assert scores == {
+            'addtocart': {'recall@3': recalls['addtocart']},
+            'transaction': {'recall@3': recalls['transaction']}
+        }
+
+    def test_metrics_at_cutoffs(self):
+        scores = compute_metrics(self.labels, self.predictions, [1, 3], catalogue_size=10)
+
+        # addtocart sessions 2, 3 and 4 with hits at ranks [1], [1, 2] and none
+        assert scores['addtocart']['hit_rate@1'] == 2 / 3
+        assert scores['addtocart']['precision@3'] == (1 / 3 + 2 / 3 + 0) / 3
+        assert scores['addtocart']['mrr@3'] == (1 + 1 + 0) / 3
+        ideal_dcg = 1 + 1 / math.log2(3) + 1 / math.log2(4)
+        assert math.isclose(scores['addtocart']['ndcg@3'], (1 / ideal_dcg + (1 + 1 / math.log2(3)) / ideal_dcg + 0) / 3)
+        # Predicted items of all sessions, including session 1 without addtocart labels
+        assert scores['addtocart']['coverage@3'] == 5 / 10
+        # transaction sessions 1 and 2 with hits at ranks [1] and none
+        assert scores['transaction']['mrr@1'] == 0.5
+        assert scores['transaction']['recall@1'] == 1 / 2
+
+    def test_mrr_counts_sessions_without_predictions(self):
+        labels = {1: {'addtocart': {1}, 'transaction': {1}}, 2: {'addtocart': {2}, 'transaction': set()}}
+        predictions = {1: {'addtocart': [1], 'transaction': [1]}}
+
+        _, mrrs = get_scores(labels, predictions, 20)
+        scores = compute_metrics(labels, predictions, [20], ['mrr'])
+
+        # get_scores skips session 2 without predictions, compute_metrics counts it as a reciprocal rank of 0
+        assert mrrs['addtocart'] == 1.0
+        assert scores['addtocart']['mrr@20'] == 0.5
+
+    def test_coverage_needs_catalogue_size(self):
+        assert 'coverage@3' not in compute_metrics(self.labels, self.predictions, [3])['addtocart']
+        with pytest.raises(ValueError):
+            compute_metrics(self.labels, self.predictions, [3], ['coverage'])
+
+    def test_default_cutoffs(self):
+        scores = compute_metrics(self.labels, self.predictions, metrics=['recall'])
+
+        assert list(scores['addtocart']) == ['recall@5', 'recall@10', 'recall@20']
+
+    @pytest.mark.parametrize("cutoffs", [[], [0, 5]])
+    def test_invalid_cutoffs(self, cutoffs):
+        with pytest.raises(ValueError, match="cutoffs"):
+            compute_metrics(self.labels, self.predictions, cutoffs)
+
+    def test_no_labels(self):
+        scores = compute_metrics({1: {'addtocart': {1}, 'transaction': set()}}, {}, [5], ['recall', 'mrr'])
+
+        assert scores == {
+            'addtocart': {'recall@5': 0.0, 'mrr@5': 0.0},
+            'transaction': {'recall@5': None, 'mrr@5': None}
+        }
+
+
+class TestEvaluateModels:
+
+    labels = {
+        1: {'addtocart': {1}, 'transaction': {2}},
+        2: {'addtocart': {3}, 'transaction': set()}
+    }
+
+    def write_predictions(self, path, rows):
+        path.write_text("session_type,labels\n" + "".join(f"{row}\n" for row in rows))
+
+    def test_evaluate_models(self, tmp_path):
+        self.write_predictions(tmp_path / "model_a.csv", ["1_addtocart,1 2", "1_transaction,2", "2_addtocart,3"])
+        self.write_predictions(tmp_path / "model_b.csv", ["1_addtocart,2 1", "1_transaction,1", "2_addtocart,1"])
+
+        paths = find_predictions_files([tmp_path])
+        model_scores = evaluate_models(self.labels, paths, [1], ['mrr'], workers=2)
+
+        assert model_scores == {
+            'model_a': {'metrics': {'addtocart': {'mrr@1': 1.0}, 'transaction': {'mrr@1': 1.0}}},
+            'model_b': {'metrics': {'addtocart': {'mrr@1': 0.0}, 'transaction': {'mrr@1': 0.0}}}
+        }
+        assert comparison_table(model_scores).splitlines() == [
+            "model    addtocart mrr@1  transaction mrr@1",
+            "model_a  1.0000           1.0000",
+            "model_b  0.0000           0.0000",
+        ]
+
+    def test_read_selected_partitions(self, tmp_path):
+        for bucket in range(3):
+            (tmp_path / f"bucket={bucket}").mkdir()
+            (tmp_path / f"bucket={bucket}" / "test_labels.jsonl").write_text(
+                f'{{"session": {bucket}, "labels": {{"addtocart": [{bucket}]}}}}\n')
+
+        assert sorted(read_labels(tmp_path)) == [0, 1, 2]
+        assert sorted(read_labels(tmp_path, partitions=["bucket=0", "bucket=2"])) == [0, 2]
+        with pytest.raises(ValueError):
+            read_labels(tmp_path, partitions=["bucket=3"])
+
+
+class TestSignificance:
+
+    labels = {
+        1: {'addtocart': {1}, 'transaction': {1}},
+        2: {'addtocart': {2}, 'transaction': set()},
+        3: {'addtocart': {3, 4}, 'transaction': set()},
+        4: {'addtocart': {5}, 'transaction': set()}
+    }
+    predictions = {
+        1: {'addtocart': [1], 'transaction': [1]},
+        2: {'addtocart': [9, 2]},
+        3: {'addtocart': [3, 9]},
+        4: {'addtocart': [9, 9]}
+    }
+
+    def test_bootstrap_intervals(self):
+        ranked_by_type = rank_event_types(self.labels, self.predictions, 2)
+
+        intervals = bootstrap_intervals(ranked_by_type, [2], num_resamples=200, max_batch_elements=100)
+
+        # A single transaction session always has the same resampled score
+        assert intervals['transaction'] == {
+            'recall@2': {'low': 1.0, 'high': 1.0},
+            'mrr@2': {'low': 1.0, 'high': 1.0}
+        }
+        assert 0 <= intervals['addtocart']['recall@2']['low'] < 3 / 5 < intervals['addtocart']['recall@2']['high'] <= 1
+        assert 0 <= intervals['addtocart']['mrr@2']['low'] < 2.5 / 4 < intervals['addtocart']['mrr@2']['high'] <= 1
+
+    def test_segment_breakdown(self):
+        ranked_by_type = rank_event_types(self.labels, self.predictions, 2)
+
+        breakdown = segment_breakdown(ranked_by_type, [2], self.labels, {1: 1, 2: 1, 3: 12})
+
+        assert breakdown['addtocart'] == {
+            'label_type': {
+                'addtocart': {'sessions': 3, 'recall@2': 2 / 4, 'mrr@2': 1.5 / 3},
+                'both': {'sessions': 1, 'recall@2': 1.0, 'mrr@2': 1.0}
+            },
+            'session_length': {
+                '1': {'sessions': 2, 'recall@2': 1.0, 'mrr@2': 0.75},
+                '10+': {'sessions': 1, 'recall@2': 0.5, 'mrr@2': 1.0},
+                'unknown': {'sessions': 1, 'recall@2': 0.0, 'mrr@2': 0.0}
+            }
+        }
+
+
+class TestSampledEvaluation:
+
+    def labels_and_predictions(self, num_sessions=2000):
+        rng = np.random.default_rng(0)
+        labels, predictions = {}, {}
+        for session in range(num_sessions):
+            kind = rng.integers(3)
+            labels[session] = {'addtocart': {1, 2} if kind != 1 else set(), 'transaction': {3} if kind != 0 else set()}
+            predictions[session] = {'addtocart': rng.permutation(5)[:3].tolist(),
+                                    'transaction': rng.permutation(5)[:3].tolist()}
+        return labels, predictions
+
+    def test_sample_is_deterministic_and_stratified(self):
+        labels, _ = self.labels_and_predictions()
+        session_lengths = {session: session % 12 + 1 for session in labels}
+
+        sample = sample_sessions(labels, 0.1, session_lengths)
+
+        assert sample == sample_sessions(labels, 0.1, session_lengths)
+        assert set(sample.strata) < set(sample_sessions(labels, 0.2, session_lengths).strata)
+        assert sum(sample.population.values()) == len(labels)
+        for stratum, size in sample.population.items():
+            assert sum(1 for s in sample.strata.values() if s == stratum) == max(2, math.ceil(0.1 * size))
+
+    def test_full_sample_has_no_error(self):
+        labels, predictions = self.labels_and_predictions(200)
+        sample = sample_sessions(labels, 1.0)
+
+        estimates = sampled_estimates(rank_event_types(labels, predictions, 2), [2], sample)
+
+        scores = compute_metrics(labels, predictions, [2], ['recall', 'mrr'])
+        for event_type in ['addtocart', 'transaction']:
+            for metric in ['recall@2', 'mrr@2']:
+                assert math.isclose(estimates[event_type][metric]['estimate'], scores[event_type][metric])
+                assert estimates[event_type][metric]['standard_error'] == 0
+
+    def test_estimate_within_sampling_error(self):
+        labels, predictions = self.labels_and_predictions()
+        sample = sample_sessions(labels, 0.2)
+        sampled_labels = {session: labels[session] for session in sample.strata}
+
+        estimates = sampled_estimates(rank_event_types(sampled_labels, predictions, 2), [2], sample)
+
+        scores = compute_metrics(labels, predictions, [2], ['recall', 'mrr'])
+        for event_type in ['addtocart', 'transaction']:
+            for metric in ['recall@2', 'mrr@2']:
+                estimate = estimates[event_type][metric]
+                assert 0 < estimate['standard_error'] < 0.05
+                assert abs(estimate['estimate'] - scores[event_type][metric]) < 3 * estimate['standard_error']
+
+    def test_read_predictions_of_sessions(self, tmp_path):
+        path = tmp_path / "predictions.csv"
+        path.write_text("session_type,labels\n1_addtocart,1 2\n2_addtocart,3\n12_transaction,4\n")
+
+        assert read_predictions(path, sessions={1, 12}) == {1: {'addtocart': [1, 2]}, 12: {'transaction': [4]}}
@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+from src.data_generation.input_files import expand_input_paths, file_time_range, prune_files, scan_input_files
+
+SCHEMA = {"timestamp": pl.UInt64, "visitorid": pl.UInt32}
+
+
+class TestInputFiles:
+
+    def test_file_time_range(self):
+        day = 1430611200  # 2015-05-03
+        assert file_time_range(Path("events_2015-05-03.csv")) == (day, day + 24 * 60 * 60)
+        assert file_time_range(Path("hourly/events-2015050314.csv")) == (day + 14 * 60 * 60, day + 15 * 60 * 60)
+        assert file_time_range(Path("sessions/day=2015-05-03/part-0.parquet")) == (day, day + 24 * 60 * 60)
+        assert file_time_range(Path("events.csv")) is None
+
+    def test_prune_files(self):
+        paths = [Path("events_2015-05-02.csv"), Path("events_2015-05-03.csv"), Path("events.csv")]
+
+        assert prune_files(paths, 1430611200, None) == [Path("events_2015-05-03.csv"), Path("events.csv")]
+        assert prune_files(paths, None, 1430611200) == [Path("events_2015-05-02.csv"), Path("events.csv")]
+
+    def test_scan_directory_of_csv_and_parquet_files(self, tmp_path):
+        pl.DataFrame({"timestamp": [1000, 2000], "visitorid": [1, 2]}).write_csv(tmp_path / "events_a.csv")
+        pl.DataFrame({"timestamp": [3000, 4000], "visitorid": [3, 4]}).write_csv(tmp_path / "events_b.csv")
+        pl.DataFrame({"timestamp": [5000], "visitorid": [5]}).write_parquet(tmp_path / "events_c.parquet")
+        (tmp_path / "notes.txt").write_text("not an input file")
+
+        paths = expand_input_paths(tmp_path)
+        result = scan_input_files(paths, SCHEMA, start_ts=2, end_ts=5).collect().sort("timestamp")
+
+        assert paths == [tmp_path / "events_a.csv", tmp_path / "events_b.csv", tmp_path / "events_c.parquet"]
+        assert result.schema == pl.Schema(SCHEMA)
+        assert result.get_column("visitorid").to_list() == [2, 3, 4]
+
+    def test_invalid_dates_are_ignored(self):
+        assert file_time_range(Path("runs/12345678/events.csv")) is None
+        assert file_time_range(Path("events_20150231.csv")) is None
+        assert prune_files([Path("events_20150231.csv")], 1430611200, None) == [Path("events_20150231.csv")]
+
+    def test_directories_are_not_searched_recursively(self, tmp_path):
+        pl.DataFrame({"timestamp": [1000], "visitorid": [1]}).write_csv(tmp_path / "events.csv")
+        (tmp_path / "generated").mkdir()
+        pl.DataFrame({"timestamp": [2000], "visitorid": [2]}).write_csv(tmp_path / "generated" / "events.csv")
+        pl.DataFrame({"categoryid": [1], "parentid": [2]}).write_csv(tmp_path / "category_tree.csv")
+
+        assert expand_input_paths(tmp_path, "events*") == [tmp_path / "events.csv"]
+        assert expand_input_paths(tmp_path, "**/events*") == [tmp_path / "events.csv",
+                                                              tmp_path / "generated" / "events.csv"]
+
+    def test_glob_without_matches(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            expand_input_paths(tmp_path / "*.csv")
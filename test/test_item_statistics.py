@@ -0,0 +1,55 @@
+import numpy as np
+import polars as pl
+
+from src.data_generation.train_test_split import collapse_repeated_events
+from src.features.item_statistics import ItemStatistics, item_statistics, main, to_dense_array
+
+DAY = 24 * 60 * 60
+
+
+class TestItemStatistics:
+
+    sessions_df = pl.DataFrame({
+        "timestamp": [1000000000, 1000000000 + 7 * DAY, 1000000000 + 7 * DAY, 1000000000 + 14 * DAY, 1000000000],
+        "event": ["view", "addtocart", "view", "transaction", "view"],
+        "itemid": [3, 3, 1, 3, 5],
+        "session": [1, 1, 2, 2, 3]
+    })
+
+    def test_item_statistics(self):
+        statistics = to_dense_array(item_statistics(self.sessions_df, 1000000000 + 14 * DAY, 7.))
+
+        assert len(statistics) == 6
+        assert statistics["views"].tolist() == [0, 1, 0, 1, 0, 1]
+        assert statistics["addtocarts"].tolist() == [0, 0, 0, 1, 0, 0]
+        assert statistics["transactions"].tolist() == [0, 0, 0, 1, 0, 0]
+        assert np.allclose(statistics["popularity"], [0, 0.5, 0, 0.25 + 0.5 + 1, 0, 0.25])
+        assert statistics["last_seen"].tolist() == [0, 1000000000 + 7 * DAY, 0, 1000000000 + 14 * DAY, 0, 1000000000]
+
+    def test_collapsed_events_count_as_raw_events(self):
+        raw_df = pl.DataFrame({
+            "timestamp": [1000000000, 1000000060, 1000000120, 1000000180, 1000000240, 1000000000, 1000000300],
+            "event": ["view", "view", "view", "addtocart", "addtocart", "view", "view"],
+            "itemid": [3, 3, 3, 3, 3, 1, 3],
+            "session": [1, 1, 1, 1, 1, 2, 2]
+        })
+        max_ts = 1000000000 + 7 * DAY
+
+        raw = item_statistics(raw_df, max_ts)
+        collapsed = item_statistics(collapse_repeated_events(raw_df), max_ts)
+
+        columns = ["itemid", "views", "addtocarts", "transactions", "last_seen"]
+        assert collapsed.select(columns).equals(raw.select(columns))
+        assert np.allclose(collapsed.get_column("popularity").to_numpy(), raw.get_column("popularity").to_numpy())
+
+    def test_load_item_statistics(self, tmp_path):
+        self.sessions_df.write_csv(tmp_path / "train_set.csv")
+
+        main(tmp_path, tmp_path, 7.)
+        statistics = ItemStatistics(tmp_path / "item_statistics.npy")
+
+        assert 3 in statistics and 2 not in statistics and 100 not in statistics
+        assert statistics[3]["addtocarts"] == 1
+        assert statistics[100]["views"] == 0
+        assert statistics.top_items(2) == [3, 1]
+        assert statistics.top_items(5, by="views") == [1, 3, 5]
@@ -0,0 +1,47 @@
+import json
+
+import numpy as np
+import polars as pl
+
+from src.evaluate import read_predictions
+from src.models.markov import (build_transition_matrix, load_transition_matrix, main, save_transition_matrix,
+                               score_sessions)
+
+
+class TestMarkov:
+
+    def test_build_transition_matrix(self, tmp_path, train_df):
+        matrix = build_transition_matrix(train_df)
+
+        # Transitions 1->2 (twice), 2->1, 1->3 and 5->4
+        assert matrix.indptr.tolist() == [0, 0, 2, 3, 3, 3, 4]
+        assert matrix.indices.tolist() == [2, 3, 1, 4]
+        assert np.allclose(matrix.data, [2 / 3, 1 / 3, 1, 1])
+        assert matrix.popular.tolist() == [2, 1, 3, 4]
+
+        save_transition_matrix(matrix, tmp_path / "markov.npz")
+        loaded = load_transition_matrix(tmp_path / "markov.npz")
+        assert all(np.array_equal(a, b) for a, b in zip(loaded, matrix))
+
+    def test_score_sessions(self, train_df):
+        matrix = build_transition_matrix(train_df, max_next_items=1)
+        events_df = pl.DataFrame({
+            "timestamp": [1, 2, 1, 1],
+            "event": ["addtocart", "view", "view", "view"],
+            "itemid": [5, 1, 2, 99],
+            "session": [10, 10, 11, 12]
+        })
+
+        recommendations = score_sessions(matrix, events_df, k=3, recency_decay=0.5)
+
+        # Session 10: 1->2 with 2/3 and 5->4 with 2 * 0.5, then padded with popular items
+        assert recommendations == {10: [4, 2, 1], 11: [1, 2, 3], 12: [2, 1, 3]}
+
+    def test_predictions_file(self, tmp_path, train_df):
+        train_df.write_csv(tmp_path / "train_set.csv")
+        events = [{"itemid": 1, "timestamp": 1, "event": "view"}]
+        (tmp_path / "test_sessions.jsonl").write_text(json.dumps({"session": 7, "events": events}) + "\n")
+
+        main(tmp_path, tmp_path / "test_sessions.jsonl", tmp_path / "markov.csv", k=2)
+
+        assert read_predictions(tmp_path / "markov.csv") == {7: {"addtocart": [2, 3], "transaction": [2, 3]}}
@@ -0,0 +1,37 @@
+from src.parse_cache import cache_path, load_cached, read_cache, write_cache
+
+KEYS = ('addtocart', 'transaction')
+
+
+class TestParseCache:
+
+    def test_round_trip(self, tmp_path):
+        source = tmp_path / "predictions.csv"
+        source.write_text("session_type,labels\n")
+        parsed = {1: {'addtocart': [3, 2, 3], 'transaction': []}, 5: {'transaction': [7]}, 6: {}}
+
+        write_cache(source, parsed, KEYS)
+
+        assert read_cache(source, KEYS) == parsed
+        assert read_cache(source, KEYS, container=set) == {
+            1: {'addtocart': {2, 3}, 'transaction': set()}, 5: {'transaction': {7}}, 6: {}
+        }
+
+    def test_stale_cache_is_parsed_again(self, tmp_path):
+        source = tmp_path / "labels.jsonl"
+        source.write_text("first")
+        calls = []
+
+        def parse(path):
+            calls.append(path.read_text())
+            return {len(calls): {'addtocart': [len(calls)]}}
+
+        assert load_cached(source, parse, KEYS) == {1: {'addtocart': [1]}}
+        assert load_cached(source, parse, KEYS) == {1: {'addtocart': [1]}}
+        assert cache_path(source).exists()
+
+        source.write_text("second version")
+
+        assert read_cache(source, KEYS) is None
+        assert load_cached(source, parse, KEYS) == {2: {'addtocart': [2]}}
+        assert calls == ["first", "second version"]
@@ -0,0 +1,32 @@
+import pytest
+
+from src.data_generation import product_category_tree, testset_labels, train_test_split
+from src.data_generation.synthetic_dataset import main as generate_dataset
+from src.pipeline import main
+
+
+class TestPipeline:
+
+    @pytest.mark.parametrize("collapse_repeats", [False, True])
+    def test_same_outputs_as_separate_stages(self, tmp_path, collapse_repeats):
+        input_path, pipeline_path, stages_path = tmp_path / "input", tmp_path / "pipeline", tmp_path / "stages"
+        for path in (input_path, pipeline_path, stages_path):
+            path.mkdir()
+        generate_dataset(input_path, 20_000, 300, 20, 5, 1.1, 0.05, 0, 20_000)
+
+        main(input_path, pipeline_path, 3, 2, 42, chunk_size=1000, collapse_repeats=collapse_repeats)
+        train_test_split.main(input_path, stages_path, 3, 2, collapse_repeats=collapse_repeats)
+        testset_labels.main(stages_path / "test_set.csv", stages_path, 42, 1000)
+        product_category_tree.main(stages_path, input_path, stages_path, 3, 2)
+
+        for name in ["train_set.csv", "test_set.csv", "test_sessions.jsonl", "test_labels.jsonl",
+                     "item_categories.csv"]:
+            assert (pipeline_path / name).read_text() == (stages_path / name).read_text(), name
+
+    def test_selected_stages(self, tmp_path):
+        generate_dataset(tmp_path, 20_000, 300, 20, 5, 1.1, 0.05, 0, 20_000)
+
+        main(tmp_path, tmp_path, stages=["split"])
+        assert not (tmp_path / "test_labels.jsonl").exists()
+        main(tmp_path, tmp_path, stages=["labels", "categories"], chunk_size=1000)
+        assert (tmp_path / "test_labels.jsonl").exists() and (tmp_path / "item_categories.csv").exists()
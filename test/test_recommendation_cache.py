@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from src.evaluate import read_predictions
+from src.models import markov, session_knn
+from src.models.recommendation_cache import (CachedRecommender, RecommendationCache, build_cache_table, cache_keys,
+                                             main)
+from src.replay import MarkovRecommender
+
+
+class TestRecommendationCache:
+
+    test_sessions = [
+        {"session": 7, "events": [{"itemid": 1, "timestamp": 1, "event": "view"}]},
+        {"session": 8, "events": [{"itemid": 5, "timestamp": 1, "event": "addtocart"}]},
+        {"session": 9, "events": [{"itemid": 5, "timestamp": 1, "event": "view"},
+                                  {"itemid": 1, "timestamp": 2, "event": "view"}]},
+    ]
+
+    def write_dataset(self, path, train_df):
+        train_df.write_csv(path / "train_set.csv")
+        (path / "test_sessions.jsonl").write_text(
+            "".join(json.dumps(session) + "\n" for session in self.test_sessions))
+
+    def test_build_cache_table(self, train_df):
+        keys_df = cache_keys(train_df)
+
+        rows, items = build_cache_table(keys_df, {0: [2, 3], 1: [5]}, k=2)
+
+        assert keys_df.rows() == [(1, "view"), (2, "view"), (3, "addtocart"), (4, "view"), (5, "view")]
+        assert rows.shape == (6, 3)
+        assert rows[1].tolist() == [0, -1, -1]
+        assert rows[3].tolist() == [-1, 2, -1]
+        assert items[1].tolist() == [[5, -1], [5, -1]]
+
+    def test_lookup_counters(self, tmp_path, train_df):
+        self.write_dataset(tmp_path, train_df)
+        main(tmp_path, tmp_path / "cache", "markov", k=2)
+        cache = RecommendationCache(tmp_path / "cache")
+
+        assert cache.lookup(1, "view", 2) == {"addtocart": [2, 3], "transaction": [2, 3]}
+        # Item 5 was only viewed in the train set and item 99 is unknown
+        assert cache.lookup(5, "addtocart", 2) is None
+        assert cache.lookup(99, "view", 2) is None
+        assert cache.counters() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3}
+
+        with pytest.raises(ValueError):
+            cache.check("markov", {"max_next_items": 100}, 20)
+        with pytest.raises(ValueError):
+            cache.check("knn", {"max_next_items": 100}, 2)
+
+    @pytest.mark.parametrize("model", ["markov", "knn"])
+    def test_cached_predictions_match_scored_predictions(self, tmp_path, model, train_df):
+        self.write_dataset(tmp_path, train_df)
+        module = markov if model == "markov" else session_knn
+        main(tmp_path, tmp_path / "cache", model, k=3)
+
+        module.main(tmp_path, tmp_path / "test_sessions.jsonl", tmp_path / "scored.csv", k=3)
+        module.main(tmp_path, tmp_path / "test_sessions.jsonl", tmp_path / "cached.csv", k=3,
+                    cache_path=tmp_path / "cache")
+
+        assert read_predictions(tmp_path / "cached.csv") == read_predictions(tmp_path / "scored.csv")
+
+    def test_cached_recommender(self, tmp_path, train_df):
+        self.write_dataset(tmp_path, train_df)
+        main(tmp_path, tmp_path / "cache", "markov", k=3)
+        cache = RecommendationCache(tmp_path / "cache")
+        matrix = markov.build_transition_matrix(train_df)
+        recommender = CachedRecommender(MarkovRecommender(matrix), cache)
+        reference = MarkovRecommender(matrix)
+
+        for session in self.test_sessions:
+            recommender.start_session(session["session"])
+            reference.start_session(session["session"])
+            for event in session["events"]:
+                recommender.update(event)
+                reference.update(event)
+                assert recommender.recommend(3) == reference.recommend(3)
+
+        # Only the first event of a session is looked up
+        assert (cache.hits, cache.misses) == (2, 1)
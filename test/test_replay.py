@@ -0,0 +1,70 @@
+import json
+
+import numpy as np
+import polars as pl
+
+from src.models.markov import build_transition_matrix, score_sessions
+from src.replay import MarkovRecommender, latency_histogram, main, replay, replay_report
+
+
+class TestReplay:
+
+    test_df = pl.DataFrame({
+        "timestamp": [1, 2, 3, 4, 1, 2, 1],
+        "event": ["view", "view", "addtocart", "transaction", "view", "addtocart", "view"],
+        "itemid": [5, 1, 2, 2, 1, 3, 7],
+        "session": [10, 10, 10, 10, 11, 11, 12]
+    })
+
+    def test_incremental_scores_match_batch_scores(self, train_df):
+        matrix = build_transition_matrix(train_df)
+        recommender = MarkovRecommender(matrix, recency_decay=0.5)
+        events_df = self.test_df.filter(pl.col("session") == 10)
+
+        recommender.start_session(10)
+        for length, event in enumerate(events_df.rows(named=True), start=1):
+            recommender.update(event)
+            expected = score_sessions(matrix, events_df.head(length), k=3, recency_decay=0.5, max_events=length)
+            assert recommender.recommend(3) == expected[10]
+
+    def test_replay_prefixes(self, train_df):
+        recommender = MarkovRecommender(build_transition_matrix(train_df))
+
+        result = replay(recommender, self.test_df, k=2)
+
+        # The last event of a session is not replayed, session 12 has a single event
+        assert len(result.latencies) == 4
+        assert list(result.labels.values()) == [
+            {"addtocart": [2], "transaction": [2]}, {"addtocart": [2], "transaction": [2]}, {"transaction": [2]},
+            {"addtocart": [3]}]
+        assert list(result.prefix_lengths.values()) == [1, 2, 3, 1]
+        # After item 1 of session 11 the transition 1->2 ranks first, 1->3 second
+        assert result.predictions[3]["addtocart"] == [2, 3]
+
+        report = replay_report(result, cutoffs=[1, 2])
+        assert report["prefixes"] == 4
+        assert report["metrics"]["addtocart"]["recall@2"] == 1.
+        assert report["breakdown"]["addtocart"]["prefix_length"]["1"]["sessions"] == 2
+
+    def test_max_sessions(self, train_df):
+        result = replay(MarkovRecommender(build_transition_matrix(train_df)), self.test_df, max_sessions=1)
+
+        assert list(result.prefix_lengths.values()) == [1, 2, 3]
+
+    def test_latency_histogram(self):
+        summary = latency_histogram(np.array([5_000, 15_000, 15_000, 50_000_000]))
+
+        assert summary["events"] == 4
+        assert summary["histogram"]["0-10us"] == 1
+        assert summary["histogram"]["10-20us"] == 2
+        assert summary["histogram"]["10000us+"] == 1
+
+    def test_report_file(self, tmp_path, train_df):
+        train_df.write_csv(tmp_path / "train_set.csv")
+        self.test_df.write_csv(tmp_path / "test_set.csv")
+
+        main(tmp_path, tmp_path / "test_set.csv", cutoffs=[2], output_path=tmp_path / "replay.json")
+
+        report = json.loads((tmp_path / "replay.json").read_text())
+        assert report["latency"]["events"] == 4
+        assert set(report["metrics"]) == {"addtocart", "transaction"}
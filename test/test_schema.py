@@ -0,0 +1,53 @@
+import polars as pl
+
+from src.data_generation.schema import COMPACT_SESSIONS_SCHEMA, encode_itemids, to_compact_schema
+
+
+class TestEncodeItemids:
+
+    def test_numeric_itemids_are_cast(self, tmp_path):
+        events_df = pl.DataFrame({"itemid": ["3", "1", "3"], "event": ["view", "view", "addtocart"]})
+
+        result = encode_itemids(events_df, tmp_path)
+
+        assert result.schema["itemid"] == pl.UInt32
+        assert result.get_column("itemid").to_list() == [3, 1, 3]
+        assert not (tmp_path / "item_dictionary.csv").exists()
+
+    def test_non_numeric_itemids_use_dictionary(self, tmp_path):
+        events_df = pl.DataFrame({"itemid": ["b", "a", "b"], "event": ["view", "view", "addtocart"]})
+
+        result = encode_itemids(events_df, tmp_path)
+
+        assert result.get_column("itemid").to_list() == [1, 0, 1]
+        assert pl.read_csv(tmp_path / "item_dictionary.csv").to_dict(as_series=False) == {
+            "code": [0, 1],
+            "itemid": ["a", "b"]
+        }
+
+    def test_dictionary_is_extended_across_batches(self, tmp_path):
+        encode_itemids(pl.DataFrame({"itemid": ["b", "a"], "event": ["view", "view"]}), tmp_path)
+
+        result = encode_itemids(pl.DataFrame({"itemid": ["c", "b", "0"], "event": ["view", "view", "view"]}), tmp_path)
+
+        assert result.get_column("itemid").to_list() == [3, 1, 2]
+        assert pl.read_csv(tmp_path / "item_dictionary.csv").to_dict(as_series=False) == {
+            "code": [0, 1, 2, 3],
+            "itemid": ["a", "b", "0", "c"]
+        }
+
+
+class TestToCompactSchema:
+
+    def test_cast_to_compact_schema(self):
+        sessions_df = pl.DataFrame({
+            "timestamp": [1000000000, 1000000100],
+            "event": ["view", "transaction"],
+            "itemid": [1, 2],
+            "session": [1, 1]
+        })
+
+        result = to_compact_schema(sessions_df)
+
+        assert result.schema == pl.Schema(COMPACT_SESSIONS_SCHEMA)
+        assert result.get_column("event").to_physical().to_list() == [0, 2]
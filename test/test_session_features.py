@@ -0,0 +1,57 @@
+import json
+
+import polars as pl
+
+from src.data_generation.train_test_split import collapse_repeated_events
+from src.features.session_features import main, session_features
+
+
+class TestSessionFeatures:
+
+    def test_session_features(self):
+        sessions_df = pl.DataFrame({
+            "timestamp": [1000000100, 1000000000, 1000000400, 1000000000],
+            "event": ["addtocart", "view", "addtocart", "view"],
+            "itemid": [1, 1, 2, 3],
+            "session": [1, 1, 1, 2]
+        })
+
+        assert session_features(sessions_df).to_dict(as_series=False) == {
+            "session": [1, 2],
+            "length": [3, 1],
+            "distinct_items": [2, 1],
+            "addtocarts": [2, 0],
+            "duration": [400, 0],
+            "last_event": ["addtocart", "view"],
+            "last_event_gap": [300, None]
+        }
+
+    def test_collapsed_events_count_as_raw_events(self):
+        raw_df = pl.DataFrame({
+            "timestamp": [1000000000, 1000000100, 1000000200, 1000000300, 1000000400],
+            "event": ["view", "view", "addtocart", "addtocart", "view"],
+            "itemid": [1, 1, 1, 1, 2],
+            "session": [1, 1, 1, 1, 1]
+        })
+
+        raw = session_features(raw_df)
+        collapsed = session_features(collapse_repeated_events(raw_df))
+
+        assert collapsed.equals(raw)
+
+    def test_train_and_test_features(self, tmp_path):
+        pl.DataFrame({
+            "timestamp": [1000000000, 1000000100],
+            "event": ["view", "transaction"],
+            "itemid": [1, 1],
+            "session": [1, 1]
+        }).write_csv(tmp_path / "train_set.csv")
+        events = [{"itemid": 4, "timestamp": 1000000000, "event": "view"},
+                  {"itemid": 4, "timestamp": 1000000060, "event": "view"}]
+        (tmp_path / "test_sessions.jsonl").write_text(json.dumps({"session": 7, "events": events}) + "\n")
+
+        main(tmp_path, tmp_path / "test_sessions.jsonl", tmp_path)
+
+        assert pl.read_parquet(tmp_path / "train_session_features.parquet").row(0) == (1, 2, 1, 0, 100, "transaction",
+                                                                                        100)
+        assert pl.read_parquet(tmp_path / "test_session_features.parquet").row(0) == (7, 2, 1, 0, 60, "view", 60)
@@ -0,0 +1,50 @@
+import json
+
+import polars as pl
+
+from src.evaluate import read_predictions
+from src.models.session_knn import build_session_index, main, predict, recommend
+
+
+class TestSessionKnn:
+
+    train_df = pl.DataFrame({
+        "timestamp": [1, 2, 3, 5, 6, 2, 3, 9, 9],
+        "itemid": [1, 2, 2, 1, 3, 4, 5, 1, 4],
+        "session": [10, 10, 10, 11, 11, 12, 12, 13, 13]
+    })
+
+    def test_build_session_index(self):
+        index = build_session_index(self.train_df, max_sessions_per_item=2)
+
+        # Item 1 is in sessions 10, 11 and 13, only the two most recent are kept
+        assert index.item_indptr.tolist() == [0, 0, 2, 3, 4, 6, 7]
+        assert index.item_sessions.tolist() == [3, 1, 0, 1, 3, 2, 2]
+        assert index.session_indptr.tolist() == [0, 2, 4, 6, 8]
+        assert index.session_items.tolist() == [1, 2, 1, 3, 4, 5, 1, 4]
+        assert index.session_timestamps.tolist() == [3, 6, 3, 9]
+        assert index.popular.tolist() == [1, 4, 2, 3, 5]
+
+    def test_recommend(self):
+        index = build_session_index(self.train_df)
+
+        # Session 13 contains both items and has similarity 1, sessions 10, 11 and 12 have similarity 1 / 2
+        assert recommend(index, [1, 4], k=3) == [1, 4, 2]
+        # Only the most recent candidate (session 13) is scored
+        assert recommend(index, [1], k=2, sample_size=1) == [1, 4]
+        assert recommend(index, [99], k=2) == [1, 4]
+
+    def test_predict_with_workers(self):
+        index = build_session_index(self.train_df)
+        sessions = [(session, [session % 6]) for session in range(20)]
+
+        assert predict(index, sessions, 3, workers=2, batch_size=7) == predict(index, sessions, 3)
+
+    def test_predictions_file(self, tmp_path):
+        self.train_df.write_csv(tmp_path / "train_set.csv")
+        events = [{"itemid": 3, "timestamp": 1, "event": "view"}]
+        (tmp_path / "test_sessions.jsonl").write_text(json.dumps({"session": 7, "events": events}) + "\n")
+
+        main(tmp_path, tmp_path / "test_sessions.jsonl", tmp_path / "knn.csv", k=2)
+
+        assert read_predictions(tmp_path / "knn.csv") == {7: {"addtocart": [1, 3], "transaction": [1, 3]}}
@@ -0,0 +1,30 @@
+import polars as pl
+
+from src.data_generation.synthetic_dataset import main
+
+
+class TestSyntheticDataset:
+
+    def test_files_match_input_schemas(self, tmp_path):
+        main(tmp_path, 10_000, 500, 20, 3, 1.1, 0.05, 0, 3_000)
+
+        events_df = pl.read_csv(tmp_path / "events.csv", schema={
+            "timestamp": pl.UInt64, "visitorid": pl.UInt32, "event": pl.Utf8, "itemid": pl.Utf8,
+            "transactionid": pl.UInt32
+        })
+        assert events_df.height == 10_000
+        assert set(events_df.get_column("event").unique()) == {"view", "addtocart", "transaction"}
+        assert events_df.filter(pl.col("event") == "transaction").get_column("transactionid").is_unique().all()
+        assert events_df.filter(pl.col("event") != "transaction").get_column("transactionid").is_null().all()
+
+        properties_schema = {"timestamp": pl.UInt64, "itemid": pl.UInt32, "property": pl.Utf8, "value": pl.Utf8}
+        item_properties_df = pl.concat([
+            pl.read_csv(tmp_path / "item_properties_part1.csv", schema=properties_schema),
+            pl.read_csv(tmp_path / "item_properties_part2.csv", schema=properties_schema)
+        ])
+        assert item_properties_df.filter(pl.col("property") == "categoryid").get_column("itemid").n_unique() == 500
+
+        category_tree_df = pl.read_csv(tmp_path / "category_tree.csv",
+                                       schema={"categoryid": pl.UInt32, "parentid": pl.UInt32})
+        assert category_tree_df.height == 20
+        assert category_tree_df.filter(pl.col("parentid") >= pl.col("categoryid")).is_empty()
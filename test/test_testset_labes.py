@@ -1,8 +1,11 @@
 import json
 from pathlib import Path
 import polars as pl
+import pytest
 
-from src.data_generation.testset_labels import ground_truth, split_events, split_test_set
+from src.data_generation.testset_labels import (ground_truth, iter_session_chunks, main, prefix_labels, split_events,
+                                                split_test_set, split_test_set_chunked, squeeze_sessions,
+                                                suffix_labels)
 
 class TestGroundTruth:
 
@@ -244,3 +247,108 @@ class TestSplitEvents:
         expected_labels = {'transaction': {1}}
         assert result[0] == expected_events
         assert result[1] == expected_labels
+
+
+class TestSuffixLabels:
+
+    def test_suffix_labels_match_ground_truth(self):
+        events = [{
+            'itemid': itemid,
+            'timestamp': 1000000000000 + i,
+            'event': event
+        } for i, (itemid, event) in enumerate([(1, 'view'), (1, 'addtocart'), (2, 'view'), (2, 'addtocart'),
+                                               (1, 'transaction'), (3, 'view'), (2, 'addtocart'), (4, 'view')])]
+
+        labelled_events = ground_truth([dict(event) for event in events])
+
+        for split_idx in range(1, len(events)):
+            assert suffix_labels(events, split_idx) == labelled_events[split_idx - 1]['labels']
+
+
+class TestPrefixLabels:
+
+    def test_prefix_labels_match_suffix_labels(self):
+        events = [{
+            'itemid': itemid,
+            'timestamp': 1000000000000 + i,
+            'event': event
+        } for i, (itemid, event) in enumerate([(1, 'view'), (1, 'addtocart'), (2, 'view'), (2, 'addtocart'),
+                                               (1, 'transaction'), (3, 'view'), (2, 'addtocart'), (4, 'view')])]
+
+        rows = prefix_labels(events)
+
+        assert [row[0] for row in rows] == [1, 2, 3, 4, 5, 6]
+        for prefix_length, carts, orders in rows:
+            labels = suffix_labels(events, prefix_length)
+            assert carts == sorted(labels.get('addtocart', []))
+            assert orders == sorted(labels.get('transaction', []))
+
+    def test_all_prefixes_output(self, tmp_path):
+        pl.DataFrame({
+            "timestamp": [1000000001, 1000000002, 1000000003, 1000000001, 1000000002, 1000000001],
+            "event": ["view", "addtocart", "view", "view", "view", "view"],
+            "itemid": [1, 2, 3, 4, 5, 6],
+            "session": [1, 1, 1, 2, 2, 3]
+        }).write_csv(tmp_path / "test_set.csv")
+
+        main(tmp_path / "test_set.csv", tmp_path, 42, all_prefixes=True)
+
+        # Sessions without labels are left out, the events of a session are written once
+        sessions = [json.loads(line) for line in (tmp_path / "test_sessions.jsonl").read_text().splitlines()]
+        assert [(session["session"], len(session["events"])) for session in sessions] == [(1, 3)]
+        assert pl.read_parquet(tmp_path / "prefix_labels.parquet").to_dicts() == [
+            {"session": 1, "prefix_length": 1, "addtocart": [2], "transaction": []},
+        ]
+
+
+class TestSplitTestSetChunked:
+
+    test_df = pl.DataFrame({
+        "timestamp": [1000000001, 1000000002, 1000000001, 1000000001, 1000000002, 1000000003, 1000000004],
+        "event": ["view", "addtocart", "view", "view", "transaction", "view", "view"],
+        "itemid": [1, 2, 3, 4, 5, 6, 7],
+        "session": [1, 1, 2, 3, 3, 4, 4]
+    })
+
+    def test_iter_session_chunks(self):
+        chunks = [chunk.get_column("session").to_list() for chunk in iter_session_chunks(self.test_df, 2)]
+
+        assert chunks == [[1, 1, 2], [3, 3, 4, 4]]
+
+    def test_chunked_output_matches_split_test_set(self, tmp_path):
+        split_test_set(squeeze_sessions(self.test_df), tmp_path / "sessions.jsonl", tmp_path / "labels.jsonl")
+        split_test_set_chunked(self.test_df, tmp_path / "chunked_sessions.jsonl", tmp_path / "chunked_labels.jsonl", 1)
+
+        assert (tmp_path / "sessions.jsonl").read_text() == (tmp_path / "chunked_sessions.jsonl").read_text()
+        assert (tmp_path / "labels.jsonl").read_text() == (tmp_path / "chunked_labels.jsonl").read_text()
+        assert [json.loads(line) for line in (tmp_path / "chunked_labels.jsonl").read_text().splitlines()] == [
+            {"session": 1, "labels": {"addtocart": [2]}},
+            {"session": 3, "labels": {"transaction": [5]}},
+            {"session": 4, "labels": {}},
+        ]
+
+
+class TestPartitionedTestSet:
+
+    def test_split_selected_partitions(self, tmp_path):
+        for bucket, session in enumerate([1, 2, 3]):
+            partition = tmp_path / "test_set" / f"bucket={bucket}"
+            partition.mkdir(parents=True)
+            pl.DataFrame({
+                "timestamp": [1000000001, 1000000002],
+                "event": ["view", "addtocart"],
+                "itemid": [session, session],
+                "session": [session, session]
+            }).write_parquet(partition / "00000000.parquet")
+
+        main(tmp_path / "test_set", tmp_path / "output", 42, partitions=["bucket=0", "bucket=2"])
+
+        assert sorted(path.name for path in (tmp_path / "output").iterdir()) == ["bucket=0", "bucket=2"]
+        labels = json.loads((tmp_path / "output" / "bucket=2" / "test_labels.jsonl").read_text())
+        assert labels == {"session": 3, "labels": {"addtocart": [3]}}
+
+    def test_unknown_partition(self, tmp_path):
+        (tmp_path / "test_set" / "bucket=0").mkdir(parents=True)
+
+        with pytest.raises(ValueError):
+            main(tmp_path / "test_set", tmp_path / "output", 42, partitions=["bucket=1"])
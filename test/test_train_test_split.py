@@ -1,7 +1,13 @@
 from pathlib import Path
+import numpy as np
 import polars as pl
+import pytest
 
-from src.data_generation.train_test_split import create_sessions, create_train_test_split
+from src.data_generation.train_test_split import (CountMinSketch, append_to_session_store, collapse_repeated_events,
+                                                  continue_sessions, create_sessions, create_train_test_split,
+                                                  create_train_test_split_contiguous, create_train_test_split_partitioned,
+                                                  filter_heavy_visitors, main, peak_memory_mb, read_session_store,
+                                                  visitor_ranges, write_partitioned)
 
 
 class TestCreateSessions:
@@ -108,6 +114,172 @@ class TestCreateSessions:
         assert result == expected_sessions
 
 
+class TestCollapseRepeatedEvents:
+
+    def test_collapse_consecutive_repeats(self):
+        sessions_df = pl.DataFrame({
+            "timestamp": [1, 2, 3, 4, 5, 6, 7, 1, 2],
+            "event": ["view", "view", "view", "addtocart", "view", "view", "view", "view", "view"],
+            "itemid": [1, 1, 1, 1, 2, 1, 1, 1, 1],
+            "session": [1, 1, 1, 1, 1, 1, 1, 2, 2]
+        })
+
+        assert collapse_repeated_events(sessions_df).to_dict(as_series=False) == {
+            "timestamp": [1, 4, 5, 6, 1],
+            "event": ["view", "addtocart", "view", "view", "view"],
+            "itemid": [1, 1, 2, 1, 1],
+            "session": [1, 1, 1, 1, 2],
+            "last_timestamp": [3, 4, 5, 7, 2],
+            "repeats": [3, 1, 1, 2, 2]
+        }
+
+
+class TestFilterHeavyVisitors:
+
+    events_df = pl.DataFrame({
+        "timestamp": [5, 1, 4, 2, 3, 1, 2],
+        "visitorid": [1, 1, 1, 1, 2, 2, 3],
+        "event": ["view"] * 7,
+        "itemid": ["1", "2", "3", "4", "5", "6", "7"],
+    }, schema_overrides={"visitorid": pl.UInt32})
+
+    def test_drop(self):
+        filtered_df, removed_events, heavy_visitors = filter_heavy_visitors(self.events_df, 2)
+
+        assert (removed_events, heavy_visitors) == (4, 1)
+        assert sorted(filtered_df.get_column("visitorid").to_list()) == [2, 2, 3]
+
+    def test_cap_keeps_first_events(self):
+        filtered_df, removed_events, _ = filter_heavy_visitors(self.events_df, 2, "cap")
+
+        assert removed_events == 2
+        assert sorted(filtered_df.filter(pl.col("visitorid") == 1).get_column("timestamp").to_list()) == [1, 2]
+
+    def test_sketch_counts_across_batches(self):
+        sketch = CountMinSketch(width=64, depth=3)
+
+        # Visitor 1 has 4 events in both batches together, only the first 3 are kept
+        first_df, removed_first, _ = filter_heavy_visitors(self.events_df.head(2), 3, "cap", sketch)
+        second_df, removed_second, _ = filter_heavy_visitors(self.events_df.tail(5), 3, "cap", sketch)
+
+        assert (removed_first, removed_second) == (0, 1)
+        assert second_df.filter(pl.col("visitorid") == 1).get_column("timestamp").to_list() == [2]
+        assert sketch.estimate(np.array([1, 2, 3], dtype=np.uint32)).tolist() == [4, 2, 1]
+
+    def test_sketch_never_underestimates(self, tmp_path):
+        visitorids = np.arange(10000, dtype=np.uint32)
+        counts = np.random.default_rng(1).integers(1, 100, len(visitorids))
+        sketch = CountMinSketch(width=1024, depth=4)
+        sketch.add(visitorids, counts)
+        sketch.save(tmp_path / "sketch.npy")
+
+        assert (CountMinSketch.load(tmp_path / "sketch.npy").estimate(visitorids) >= counts).all()
+
+    def test_unknown_action(self):
+        with pytest.raises(ValueError):
+            filter_heavy_visitors(self.events_df, 2, "sample")
+
+
+class TestContinueSessions:
+
+    state_schema = {"visitorid": pl.UInt32, "timestamp": pl.UInt32, "session": pl.UInt32}
+
+    def test_continue_open_session(self):
+        """
+        The first event of a visitor continues the open session if it is within 30 minutes
+        """
+
+        state_df = pl.DataFrame({"visitorid": [1, 2], "timestamp": [1000000000, 1000000000], "session": [1, 2]},
+                                schema=self.state_schema)
+        events_df = pl.DataFrame({
+            "timestamp": [1000000100, 1000001000, 1000005000],
+            "visitorid": [1, 1, 2],
+            "event": ["view", "addtocart", "view"],
+            "itemid": [1, 1, 2],
+            "transactionid": [None, None, None]
+        }, schema_overrides={"timestamp": pl.UInt32, "visitorid": pl.UInt32, "transactionid": pl.UInt32})
+
+        sessions_df, state_df = continue_sessions(events_df, state_df)
+
+        assert sessions_df.to_dict(as_series=False) == {
+            "timestamp": [1000000100, 1000001000, 1000005000],
+            "event": ["view", "addtocart", "view"],
+            "itemid": [1, 1, 2],
+            "session": [1, 1, 3]
+        }
+        assert state_df.sort("visitorid").to_dict(as_series=False) == {
+            "visitorid": [1, 2],
+            "timestamp": [1000001000, 1000005000],
+            "session": [1, 3]
+        }
+
+    def test_reject_events_older_than_state(self):
+        state_df = pl.DataFrame({"visitorid": [1], "timestamp": [1000000000], "session": [1]},
+                                schema=self.state_schema)
+        events_df = pl.DataFrame({
+            "timestamp": [999999999],
+            "visitorid": [1],
+            "event": ["view"],
+            "itemid": [1],
+            "transactionid": [None]
+        }, schema_overrides={"timestamp": pl.UInt32, "visitorid": pl.UInt32, "transactionid": pl.UInt32})
+
+        with pytest.raises(ValueError):
+            continue_sessions(events_df, state_df)
+
+    def test_incremental_store_matches_create_sessions(self, tmp_path):
+        """
+        Appending the events in two batches gives the same sessions as sessionizing all events at once
+        """
+
+        events_df = pl.DataFrame({
+            "timestamp": [1000000000, 1000000100, 1000010000, 1000011000, 1000000000, 1000000100, 1000000200,
+                          1000010300, 1000000400, 1000000500],
+            "visitorid": [1, 1, 1, 1, 2, 2, 2, 2, 3, 3],
+            "event": ["view", "addtocart", "transaction", "view", "view", "addtocart", "addtocart", "view", "view",
+                      "view"],
+            "itemid": [1, 1, 1, 2, 3, 3, 3, 4, 5, 6],
+            "transactionid": [None, None, 1, None, None, None, None, None, None, None]
+        }, schema_overrides={"timestamp": pl.UInt32, "visitorid": pl.UInt32, "transactionid": pl.UInt32})
+
+        append_to_session_store(events_df.filter(pl.col("timestamp") < 1000000150), tmp_path)
+        append_to_session_store(events_df.filter(pl.col("timestamp") >= 1000000150), tmp_path)
+        result = read_session_store(tmp_path)
+
+        # Single event sessions are kept in the store, so compare the events grouped into sessions
+        def grouped(df):
+            return sorted(
+                df.group_by("session").agg(pl.col("timestamp"), pl.col("itemid"))
+                .filter(pl.col("timestamp").list.len() > 1)
+                .select("timestamp", "itemid")
+                .rows()
+            )
+
+        assert grouped(result) == grouped(create_sessions(events_df))
+
+    def test_failed_append_is_not_duplicated(self, tmp_path, monkeypatch):
+        events_df = pl.DataFrame({
+            "timestamp": [1000000000, 1000000100, 1000000200],
+            "visitorid": [1, 1, 2],
+            "event": ["view", "addtocart", "view"],
+            "itemid": [1, 1, 2],
+            "transactionid": [None, None, None]
+        }, schema_overrides={"timestamp": pl.UInt32, "visitorid": pl.UInt32, "transactionid": pl.UInt32})
+        append_to_session_store(events_df.head(1), tmp_path)
+
+        # The process dies after writing the parts of the second batch, before replacing the state
+        def crash(*args):
+            raise OSError("crash")
+        monkeypatch.setattr("src.data_generation.train_test_split.os.replace", crash)
+        with pytest.raises(OSError):
+            append_to_session_store(events_df.tail(2), tmp_path)
+        assert read_session_store(tmp_path).height == 1
+
+        monkeypatch.undo()
+        append_to_session_store(events_df.tail(2), tmp_path)
+        assert read_session_store(tmp_path).get_column("timestamp").to_list() == [1000000000, 1000000100, 1000000200]
+
+
 class TestCreateTrainTestSplit:
 
     one_week_in_seconds = 604_800
@@ -273,3 +445,120 @@ class TestCreateTrainTestSplit:
         # no timestamps overlap in train and test
         assert test_min_ts > train_max_ts
 
+
+
+class TestCreateTrainTestSplitContiguous:
+
+    def test_same_as_create_train_test_split(self):
+        """
+        Contiguous split gives the same train and test sets as the default split
+        """
+
+        events_df = pl.DataFrame({
+            "timestamp": [1000000000, 1000000050, 1000000000, 1000000000, 1000000000, 1000000050, 1000000300,
+                          1000604850, 1000000000, 1000604850, 1000604900, 1000604850, 1000604850, 1000604900],
+            "event": ["view", "addtocart", "addtocart", "view", "view", "addtocart", "view", "transaction", "view",
+                      "view", "transaction", "addtocart", "view", "view"],
+            "itemid": [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+            "session": [1, 1, 2, 2, 3, 3, 3, 3, 4, 4, 4, 5, 5, 5]
+        })
+
+        train_df, test_df = create_train_test_split(events_df, 1, 1)
+        contiguous_train_df, contiguous_test_df = create_train_test_split_contiguous(events_df, 1, 1)
+
+        assert contiguous_train_df.to_dict(as_series=False) == {
+            "timestamp": [1000000000, 1000000050, 1000000000, 1000000050],
+            "event": ["view", "addtocart", "view", "addtocart"],
+            "itemid": [1, 1, 1, 1],
+            "session": [1, 1, 3, 3]
+        }
+        assert contiguous_test_df.to_dict(as_series=False) == {
+            "timestamp": [1000604850, 1000604900],
+            "event": ["view", "transaction"],
+            "itemid": [1, 1],
+            "session": [4, 4]
+        }
+        assert train_df.sort(["session", "timestamp"]).equals(contiguous_train_df)
+        assert test_df.sort(["session", "timestamp"]).equals(contiguous_test_df)
+
+
+class TestCreateTrainTestSplitPartitioned:
+
+    def events_df(self):
+        rng = np.random.default_rng(42)
+        num_events = 2000
+        return pl.DataFrame({
+            "timestamp": rng.integers(1000000000, 1000000000 + 3 * 604800, num_events),
+            "visitorid": rng.integers(0, 50, num_events),
+            "event": rng.choice(["view", "view", "addtocart", "transaction"], num_events),
+            "itemid": rng.integers(0, 20, num_events),
+            "transactionid": [None] * num_events
+        }, schema_overrides={"timestamp": pl.UInt32, "visitorid": pl.UInt32, "transactionid": pl.UInt32})
+
+    def test_memory_budget_with_session_store(self, tmp_path):
+        with pytest.raises(ValueError):
+            main(tmp_path, tmp_path, 3, 2, session_store=tmp_path / "sessions", memory_budget=1024)
+
+    def test_peak_memory_mb(self):
+        # A Python process with polars and numpy loaded uses tens of MB, not tens of GB
+        assert 10 < peak_memory_mb() < 10000
+
+    def test_visitor_ranges(self):
+        events_df = pl.DataFrame({"visitorid": [1, 1, 1, 1, 2, 3, 4, 5]})
+
+        assert visitor_ranges(events_df, 1) == [(None, None)]
+        assert visitor_ranges(events_df, 2) == [(None, 1), (1, None)]
+        assert visitor_ranges(events_df, 4) == [(None, 1), (1, 3), (3, None)]
+
+    @pytest.mark.parametrize("contiguous_split", [False, True])
+    def test_same_as_create_train_test_split(self, tmp_path, contiguous_split):
+        events_df = self.events_df()
+
+        train_df, test_df = create_train_test_split(create_sessions(events_df), 1, 1)
+        partitioned_train_df, partitioned_test_df = create_train_test_split_partitioned(
+            events_df, 1, 1, 4, tmp_path, contiguous_split)
+
+        assert partitioned_train_df.height > 0 and partitioned_test_df.height > 0
+        assert partitioned_train_df.equals(train_df.sort(["session", "timestamp"], maintain_order=True))
+        assert partitioned_test_df.equals(test_df.sort(["session", "timestamp"], maintain_order=True))
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestWritePartitioned:
+
+    sessions_df = pl.DataFrame({
+        # Session 1 continues over midnight
+        "timestamp": [1000079990, 1000080100, 1000080200, 1000080300, 1000170000, 1000170100],
+        "event": ["view", "addtocart", "view", "transaction", "view", "addtocart"],
+        "itemid": [1, 1, 2, 2, 3, 3],
+        "session": [1, 1, 2, 2, 3, 3]
+    })
+
+    def test_partition_by_day_of_first_event(self, tmp_path):
+        write_partitioned(self.sessions_df, tmp_path / "train_set", "day")
+
+        partitions = sorted(path.name for path in (tmp_path / "train_set").iterdir())
+        assert partitions == ["day=2001-09-09", "day=2001-09-10", "day=2001-09-11"]
+        assert pl.read_parquet(tmp_path / "train_set" / "day=2001-09-09").get_column("session").to_list() == [1, 1]
+
+    def test_partition_by_session_hash(self, tmp_path):
+        write_partitioned(self.sessions_df, tmp_path / "train_set", "session-hash", 2)
+        write_partitioned(self.sessions_df, tmp_path / "train_set", "session-hash", 2, overwrite=True)
+
+        result = pl.read_parquet(tmp_path / "train_set", hive_partitioning=True)
+        assert result.height == self.sessions_df.height
+        assert result.group_by("session").agg(pl.col("bucket").n_unique()).get_column("bucket").to_list() == [1, 1, 1]
+
+    def test_session_hash_is_not_modulo(self, tmp_path):
+        sessions_df = pl.DataFrame({"timestamp": [1000079990] * 64, "event": ["view"] * 64, "itemid": [1] * 64,
+                                    "session": [4 * i for i in range(64)]})
+        write_partitioned(sessions_df, tmp_path / "train_set", "session-hash", 4)
+
+        assert len(list((tmp_path / "train_set").iterdir())) == 4
+
+    def test_refuses_to_overwrite(self, tmp_path):
+        write_partitioned(self.sessions_df, tmp_path / "train_set", "day")
+
+        with pytest.raises(FileExistsError):
+            write_partitioned(self.sessions_df, tmp_path / "train_set", "session-hash", 2)
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["train_set"]